@@ -0,0 +1,172 @@
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Admission control for /api/chat: a bounded number of requests run at once, a short wait
+# queue served round-robin across clients, and a token bucket per client. Anything that does
+# not fit is rejected immediately with a Retry-After hint instead of waiting for the worker timeout.
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed; `reason` is 'rate_limited', 'queue_full' or 'queue_timeout'."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second up to `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Consume a token; return 0 on success or the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 60
+
+    def refund(self):
+        """Give back a token taken by a request that was then shed for lack of capacity."""
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class RateLimiter:
+    """A token bucket per key; only the `max_clients` most recently seen keys are remembered."""
+
+    def __init__(self, rate, burst, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """Consume a token for a key; return 0 on success or the seconds until one is available."""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(key)
+            return bucket.take()
+
+    def refund(self, key):
+        """Return a token to a key's bucket, if it is still remembered."""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.refund()
+
+
+class _Waiter:
+    def __init__(self, client_id):
+        self.client_id = client_id
+        self.event = threading.Event()
+        self.granted = False
+
+
+class AdmissionController:
+    """Bounded in-flight limit with a fair (round-robin per client) wait queue and per-client rate limits."""
+
+    def __init__(self, max_in_flight=8, max_queue=16, queue_timeout=10.0,
+                 client_rate=0.1, client_burst=3, max_clients=10000):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queues = OrderedDict()  # client_id -> deque of waiters, in round-robin order
+        self._queued = 0
+        self._limiter = RateLimiter(client_rate, client_burst, max_clients)
+        self._service_time = 5.0  # EWMA of seconds per admitted request, seeds Retry-After
+        self.counters = {'admitted': 0, 'rate_limited': 0, 'queue_full': 0, 'queue_timeout': 0}
+
+    def acquire(self, client_id):
+        """Admit a request, waiting briefly in the fair queue if needed; raises AdmissionRejected."""
+        with self._lock:
+            wait = self._limiter.take(client_id)
+            if wait:
+                self.counters['rate_limited'] += 1
+                raise AdmissionRejected('rate_limited', wait)
+
+            if self._in_flight < self.max_in_flight and not self._queued:
+                return self._admit()
+
+            if self._queued >= self.max_queue:
+                # Only admitted requests count against the client's rate; a busy server is not its fault
+                self._limiter.refund(client_id)
+                self.counters['queue_full'] += 1
+                raise AdmissionRejected('queue_full', self._estimated_wait())
+
+            waiter = _Waiter(client_id)
+            self._queues.setdefault(client_id, deque()).append(waiter)
+            self._queued += 1
+
+        waiter.event.wait(self.queue_timeout)
+        with self._lock:
+            if waiter.granted:
+                return time.monotonic()
+            # Timed out: leave the queue so the slot goes to someone still waiting
+            client_queue = self._queues.get(client_id)
+            if client_queue and waiter in client_queue:
+                client_queue.remove(waiter)
+                self._queued -= 1
+                if not client_queue:
+                    del self._queues[client_id]
+            self._limiter.refund(client_id)
+            self.counters['queue_timeout'] += 1
+            raise AdmissionRejected('queue_timeout', self._estimated_wait())
+
+    def release(self, admitted_at):
+        """Free the slot taken by acquire() and hand it to the next client in round-robin order."""
+        with self._lock:
+            elapsed = time.monotonic() - admitted_at
+            self._service_time = 0.8 * self._service_time + 0.2 * elapsed
+            self._in_flight -= 1
+            if self._queues:
+                client_id, client_queue = next(iter(self._queues.items()))
+                waiter = client_queue.popleft()
+                self._queued -= 1
+                # Move the client to the back so every waiting client gets a turn before it goes again
+                del self._queues[client_id]
+                if client_queue:
+                    self._queues[client_id] = client_queue
+                self._admit()
+                waiter.granted = True
+                waiter.event.set()
+
+    def stats(self):
+        """Return queue depth, in-flight count and shed counters."""
+        with self._lock:
+            return dict(
+                self.counters,
+                in_flight=self._in_flight,
+                queued=self._queued,
+                waiting_clients=len(self._queues),
+                max_in_flight=self.max_in_flight,
+                max_queue=self.max_queue,
+                service_time_seconds=round(self._service_time, 3)
+            )
+
+    def _admit(self):
+        self._in_flight += 1
+        self.counters['admitted'] += 1
+        return time.monotonic()
+
+    def _estimated_wait(self):
+        # Time for everything ahead of a new request to drain through the in-flight slots
+        return self._service_time * (self._queued + 1) / self.max_in_flight
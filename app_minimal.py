@@ -1,13 +1,18 @@
 from flask import Flask, render_template, request, jsonify
-import pandas as pd
-import numpy as np 
-import joblib 
+from werkzeug.middleware.proxy_fix import ProxyFix
+import hashlib
+import json
+import math
 import os
 import sys
+import threading
 import time
-from openai import OpenAI
 from dotenv import load_dotenv
-from sklearn.metrics.pairwise import cosine_similarity
+from rag_index import ShardManager, shard_path, DEFAULT_COURSE_ID, METADATA_FIELDS, EMBEDDING_DIMENSIONS
+from chat_sessions import SessionStore, is_follow_up, refers_back
+from query_journal import QueryJournal, DEFAULT_JOURNAL_PATH, encode_embedding
+from suggest_index import PrefixIndex, load_suggestions, suggestions_path
+from admission import AdmissionController, AdmissionRejected, RateLimiter
 
 # Load environment variables
 load_dotenv()
@@ -15,6 +20,12 @@ load_dotenv()
 # Initialize Flask app
 app = Flask(__name__)
 
+# X-Forwarded-For is client-controlled unless a known proxy appends to it, so it is only honoured
+# for the configured number of proxy hops (the Procfile sets 1 for the platform router)
+TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', 0))
+if TRUSTED_PROXY_COUNT > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_COUNT)
+
 # Startup logging for Gunicorn
 print("=== RAG-based AI Application Module Loaded ===")
 print(f"🔍 Environment PORT: {os.getenv('PORT', 'Not set')}")
@@ -22,35 +33,108 @@ print(f"🌐 Server will be available at the configured port")
 print(f"🔗 Health check available at: /api/health")
 print(f"🔗 Main page available at: /")
 
-# Initialize OpenAI client
+# OpenAI client is created on first use; importing the SDK dominates worker boot time
 openai_api_key = os.getenv('OPENAI_API_KEY')
 if not openai_api_key:
     print("⚠️  Warning: OPENAI_API_KEY not found in environment variables")
     print("App will start but chat functionality will be limited")
-    client = None
-else:
-    client = OpenAI(api_key=openai_api_key)
-
-# Global variable to store embeddings
-df = None
-
-def load_embeddings():
-    """Load embeddings from file."""
-    global df
-    if not os.path.exists('embeddings.joblib'):
-        raise FileNotFoundError("embeddings.joblib file not found. Please run preprocess.py first.")
-    
-    print("Loading embeddings...")
+client = None
+
+def get_client():
+    """Return the OpenAI client, creating it on first use."""
+    global client
+    if client is None and openai_api_key:
+        from openai import OpenAI
+        client = OpenAI(api_key=openai_api_key)
+    return client
+
+# Per-course index shards, loaded on first use and kept in an LRU of resident shards
+shards = ShardManager(
+    max_resident=int(os.getenv('MAX_RESIDENT_SHARDS', 4)),
+    max_workers=int(os.getenv('SHARD_SEARCH_WORKERS', 4))
+)
+
+# Server-side chat sessions so follow-up questions can reuse the previous retrieval.
+# Session ids are signed; every worker needs the same secret to accept ids issued by the others,
+# so without SESSION_SECRET one is derived from the API key (the only secret all workers share)
+session_secret = os.getenv('SESSION_SECRET')
+if session_secret:
+    session_secret = session_secret.encode('utf-8')
+elif openai_api_key:
+    session_secret = hashlib.sha256(b'chat-session-id:' + openai_api_key.encode('utf-8')).digest()
+sessions = SessionStore(
+    max_sessions=int(os.getenv('CHAT_MAX_SESSIONS', 1000)),
+    ttl_seconds=int(os.getenv('CHAT_SESSION_TTL', 1800)),
+    max_turns=int(os.getenv('CHAT_MAX_TURNS', 6)),
+    secret=session_secret
+)
+HISTORY_TOKEN_BUDGET = int(os.getenv('CHAT_HISTORY_TOKENS', 1000))
+
+# Append-only query journal written from a background thread (set QUERY_JOURNAL_PATH= to disable)
+journal_path = os.getenv('QUERY_JOURNAL_PATH', DEFAULT_JOURNAL_PATH)
+journal = QueryJournal(
+    journal_path,
+    max_bytes=int(float(os.getenv('QUERY_JOURNAL_MAX_MB', 10)) * 1024 * 1024),
+    backup_count=int(os.getenv('QUERY_JOURNAL_BACKUPS', 5)),
+    max_total_bytes=int(float(os.getenv('QUERY_JOURNAL_MAX_TOTAL_MB', 100)) * 1024 * 1024),
+    max_age_days=float(os.getenv('QUERY_JOURNAL_MAX_AGE_DAYS', 30))
+) if journal_path else None
+JOURNAL_EMBEDDINGS = os.getenv('QUERY_JOURNAL_EMBEDDINGS', '1') == '1'
+
+# Admission control: bounded in-flight chats per worker, a short fair wait queue and per-client
+# token buckets, so bursts are shed quickly instead of piling up until the gunicorn timeout.
+# Waiting requests hold a gunicorn thread, so --threads must exceed in-flight + queue (see Procfile)
+admission = AdmissionController(
+    max_in_flight=int(os.getenv('ADMISSION_MAX_IN_FLIGHT', 4)),
+    max_queue=int(os.getenv('ADMISSION_MAX_QUEUE', 8)),
+    queue_timeout=float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 10)),
+    client_rate=float(os.getenv('CLIENT_RATE_PER_MIN', 6)) / 60,
+    client_burst=float(os.getenv('CLIENT_BURST', 3))
+)
+# 'reject' answers a full queue with 429; 'fallback' serves the retrieval-only answer instead.
+# Fallback answers still embed the question, so only a few may do that at once
+ADMISSION_SHED_MODE = os.getenv('ADMISSION_SHED_MODE', 'reject')
+fallback_slots = threading.BoundedSemaphore(max(1, int(os.getenv('ADMISSION_FALLBACK_CONCURRENCY', 2))))
+# New session ids are rate limited per address, otherwise minting ids would bypass the per-client limit
+session_issuer = RateLimiter(
+    rate=float(os.getenv('SESSION_ISSUE_RATE_PER_MIN', 30)) / 60,
+    burst=float(os.getenv('SESSION_ISSUE_BURST', 60))
+)
+
+# Typeahead prefix indexes per course, built offline by suggest_index.py and loaded on first use
+suggestion_indexes = {}
+
+def get_suggestion_index(course_id):
+    """Return the typeahead index for a course (empty if none has been built)."""
+    if course_id not in suggestion_indexes:
+        path = suggestions_path(course_id)
+        if not os.path.exists(path):
+            # Not cached, so arbitrary course ids cannot grow the cache
+            return PrefixIndex()
+        suggestion_indexes[course_id] = load_suggestions(path)
+        print(f"✅ Loaded {len(suggestion_indexes[course_id])} suggestions for course '{course_id}'")
+    return suggestion_indexes[course_id]
+
+def load_embeddings(course_id=DEFAULT_COURSE_ID):
+    """Load the embeddings for a course from file."""
+    print(f"Loading embeddings for course '{course_id}'...")
     try:
-        df = joblib.load('embeddings.joblib')
-        print(f"✅ Loaded {len(df)} embeddings successfully")
-        return df
+        shard = shards.get(course_id)
+        print(f"✅ Loaded {len(shard)} embeddings successfully")
+        return shard
     except Exception as e:
         print(f"❌ Error loading embeddings: {e}")
         raise e
 
+def build_system_prompt(courses):
+    """Build the tutor system prompt for the course(s) a query is answered from."""
+    names = ", ".join(course['name'] for course in courses)
+    topics = "; ".join(course['description'] for course in courses)
+    return f"You are a helpful tutor for the {names} course. Answer questions about {topics} based on the provided video content."
+
 def create_embedding(text_list, max_retries=3):
     """Create embeddings using OpenAI API with error handling and retry logic."""
+    client = get_client()
     if client is None:
         raise Exception("OpenAI client not initialized. Please check your API key.")
     
@@ -62,7 +146,7 @@ def create_embedding(text_list, max_retries=3):
             response = client.embeddings.create(
                 model=os.getenv('OPENAI_EMBEDDING_MODEL', 'text-embedding-3-small'),
                 input=text_list,
-                dimensions=1024
+                dimensions=EMBEDDING_DIMENSIONS
             )
             
             # Extract embeddings from response
@@ -76,8 +160,9 @@ def create_embedding(text_list, max_retries=3):
                 raise Exception("All retry attempts failed. Please check your OpenAI API key and try again.")
             time.sleep(2)  # Wait before retry
 
-def inference(prompt, max_retries=3):
+def inference(prompt, system_prompt, history=None, max_retries=3):
     """Generate response using OpenAI API with error handling and retry logic."""
+    client = get_client()
     if client is None:
         raise Exception("OpenAI client not initialized. Please check your API key.")
     
@@ -89,7 +174,8 @@ def inference(prompt, max_retries=3):
             response = client.chat.completions.create(
                 model=os.getenv('OPENAI_CHAT_MODEL', 'gpt-3.5-turbo'),
                 messages=[
-                    {"role": "system", "content": "You are a helpful mathematics tutor. Answer questions about geometry and transformations based on the provided video content."},
+                    {"role": "system", "content": system_prompt},
+                    *(history or []),
                     {"role": "user", "content": prompt}
                 ],
                 max_tokens=int(os.getenv('OPENAI_MAX_TOKENS', 1000)),
@@ -131,47 +217,91 @@ def create_fallback_response(embeddings_data, query):
     
     return "\n".join(response_parts)
 
-def process_query(incoming_query):
-    """Process a single query and return response."""
-    global df
-    
-    if df is None:
-        raise Exception("Embeddings not loaded")
-    
-    print(f"Processing query: {incoming_query}")
-    
-    # Create embedding for the question
-    question_embedding = create_embedding([incoming_query])[0] 
-    
-    # Find similarities - work with numpy arrays directly
-    embeddings_list = [row['embedding'] for _, row in df.iterrows()]
-    embeddings_array = np.array(embeddings_list)
-    question_embedding_array = np.array([question_embedding])
-    
-    # Normalize embeddings to prevent overflow/underflow issues
-    embeddings_array = embeddings_array / (np.linalg.norm(embeddings_array, axis=1, keepdims=True) + 1e-8)
-    question_embedding_array = question_embedding_array / (np.linalg.norm(question_embedding_array, axis=1, keepdims=True) + 1e-8)
-    
-    similarities = cosine_similarity(embeddings_array, question_embedding_array).flatten()
+def journal_query(query, course_id, fan_out, follow_up, session, results, timings, outcome, embedding=None, error=None):
+    """Queue a journal record for a processed query; never blocks the request."""
+    if journal is None:
+        return
+    entry = {
+        'query': query,
+        'course_id': course_id,
+        'fan_out': fan_out,
+        'follow_up': follow_up,
+        'session_id': session.session_id if session else None,
+        'chunks': [
+            {'course_id': r['course_id'], 'chunk_id': r['chunk_id'], 'row': r['row'], 'score': round(float(r['score']), 6)}
+            for r in results
+        ],
+        'timings_ms': timings,
+        'models': {
+            'embedding': os.getenv('OPENAI_EMBEDDING_MODEL', 'text-embedding-3-small'),
+            'chat': os.getenv('OPENAI_CHAT_MODEL', 'gpt-3.5-turbo')
+        },
+        'outcome': outcome
+    }
+    if error:
+        entry['error'] = error
+    if embedding is not None and JOURNAL_EMBEDDINGS:
+        entry['embedding'] = encode_embedding(embedding)
+    journal.record(entry)
+
+def elapsed_ms(since):
+    """Milliseconds elapsed since a time.perf_counter() reading."""
+    return round((time.perf_counter() - since) * 1000, 1)
+
+def process_query(incoming_query, course_id=DEFAULT_COURSE_ID, fan_out=False, session=None, retrieval_only=False):
+    """Process a single query against one course (or all courses when fanning out) and return response.
+
+    With retrieval_only the LLM call is skipped and the fallback answer is built from the retrieved chunks.
+    """
+    print(f"Processing query for {'all courses' if fan_out else f'course {course_id!r}'}: {incoming_query}")
     
+    started = time.perf_counter()
+    timings = {}
+    question_embedding = None
+    previous_chunks = session.last_chunks() if session else []
+    follow_up = bool(previous_chunks) and is_follow_up(incoming_query, session.last_context_words())
     top_results = 5
-    max_indx = similarities.argsort()[::-1][0:top_results]
+    try:
+        if follow_up:
+            # Follow-up about the same material: widen the previous result set instead of embedding and searching again
+            print("Follow-up question detected, reusing previous retrieval")
+            stage = time.perf_counter()
+            results = shards.expand(previous_chunks)
+            timings['search_ms'] = elapsed_ms(stage)
+            # Nothing left to reuse when the course was rebuilt since the previous turn
+            follow_up = bool(results)
+        if not follow_up:
+            # Create embedding for the question
+            stage = time.perf_counter()
+            question_embedding = create_embedding([incoming_query])[0] 
+            timings['embed_ms'] = elapsed_ms(stage)
+            
+            # Index rows are pre-normalized, so cosine similarity is a single dot product
+            stage = time.perf_counter()
+            if fan_out:
+                results = shards.search_many(question_embedding, top_k=top_results)
+            else:
+                results = shards.search(course_id, question_embedding, top_results)
+            if previous_chunks and refers_back(incoming_query):
+                # Refers back but brings in new topic words: extend the fresh results with the previous best chunks
+                seen = {(result['course_id'], result['row']) for result in results}
+                best_previous = sorted(previous_chunks, key=lambda ref: -ref[2])[:2]
+                previous = [ref for ref in best_previous if (ref[0], ref[1]) not in seen]
+                results = results + shards.expand(previous, window=0)
+            timings['search_ms'] = elapsed_ms(stage)
+    except Exception as e:
+        timings['total_ms'] = elapsed_ms(started)
+        journal_query(incoming_query, course_id, fan_out, follow_up, session, [], timings, 'error', question_embedding, str(e))
+        raise
+    top_results_data = [{field: result[field] for field in METADATA_FIELDS} for result in results]
     
-    # Get top results without pandas
-    top_results_data = []
-    for idx in max_indx:
-        row = df.iloc[idx]
-        top_results_data.append({
-            'title': row['title'],
-            'number': row['number'],
-            'start': row['start'],
-            'end': row['end'],
-            'text': row['text']
-        })
+    # Describe only the courses that contributed chunks
+    course_ids = list(dict.fromkeys(result['course_id'] for result in results)) or [course_id]
+    courses = [shards.get(cid).course for cid in course_ids]
+    course_names = ", ".join(course['name'] for course in courses)
     
     # Create prompt
-    import json
-    prompt = f'''I am teaching Mathematics in my Math Class course. Here are video subtitle chunks containing video title, video number, start time in seconds, end time in seconds, the text at that time:
+    prompt = f'''I am teaching my {course_names} course. Here are video subtitle chunks containing video title, video number, start time in seconds, end time in seconds, the text at that time:
 
 {json.dumps(top_results_data, indent=2)}
 ---------------------------------
@@ -179,14 +309,31 @@ def process_query(incoming_query):
 User asked this question related to the video chunks, you have to answer in a human way (dont mention the above format, its just for you) where and how much content is taught in which video (in which video and at what timestamp) and guide the user to go to that particular video. If user asks unrelated question, tell him that you can only answer questions related to the course
 '''
     
+    # Earlier turns of the conversation, trimmed to the history token budget
+    history = session.history_messages(HISTORY_TOKEN_BUDGET) if session else []
+    
     # Generate response
-    try:
-        response_data = inference(prompt)
-        response = response_data["response"]
-    except Exception as e:
-        print(f"API error: {e}")
-        # Fallback response when API times out
+    stage = time.perf_counter()
+    if retrieval_only:
         response = create_fallback_response(top_results_data, incoming_query)
+        outcome = 'shed_fallback'
+    else:
+        try:
+            response_data = inference(prompt, build_system_prompt(courses), history)
+            response = response_data["response"]
+            outcome = 'answered'
+        except Exception as e:
+            print(f"API error: {e}")
+            # Fallback response when API times out
+            response = create_fallback_response(top_results_data, incoming_query)
+            outcome = 'fallback'
+    timings['llm_ms'] = elapsed_ms(stage)
+    timings['total_ms'] = elapsed_ms(started)
+    
+    if session:
+        session.add_turn(incoming_query, response, results)
+    
+    journal_query(incoming_query, course_id, fan_out, follow_up, session, results, timings, outcome, question_embedding)
     
     return response
 
@@ -201,10 +348,15 @@ def status():
     """Simple status endpoint for debugging."""
     return jsonify({
         'status': 'running',
-        'embeddings_loaded': df is not None,
+        'embeddings_loaded': bool(shards.resident_courses()),
+        'resident_courses': shards.resident_courses(),
+        'available_courses': shards.available_courses(),
+        'active_sessions': len(sessions),
+        'journal_dropped': journal.dropped if journal else None,
+        'admission': admission.stats(),
         'timestamp': time.time(),
         'port': os.getenv('PORT', 'Not set'),
-        'openai_configured': client is not None
+        'openai_configured': openai_api_key is not None
     })
 
 @app.route('/test')
@@ -216,31 +368,112 @@ def test():
         'timestamp': time.time()
     })
 
+def client_key(session_id):
+    """Identify the client for rate limiting: its server-issued chat session, else its address."""
+    # Students behind one school NAT share an address, so an issued session is the better key.
+    # Unsigned ids are ignored, otherwise a fresh random id per request would get a fresh bucket
+    if sessions.is_issued(session_id):
+        return f"session:{session_id}"
+    return f"ip:{request.remote_addr}"
+
+def rate_limited(error, retry_after, **fields):
+    """Build a 429 response with a Retry-After header."""
+    response = jsonify(dict(fields, error=error, retry_after=retry_after))
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+@app.route('/api/session', methods=['POST'])
+def new_session():
+    """Issue a chat session id before the first question, so first messages are not keyed by address."""
+    wait = session_issuer.take(f"ip:{request.remote_addr}")
+    if wait:
+        return rate_limited('Too many new sessions from this address. Please try again shortly.',
+                            max(1, math.ceil(wait)))
+    return jsonify({'session_id': sessions.issue_id()})
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """Handle chat messages."""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get('message', ''), str):
+            return jsonify({'error': 'Expected a JSON object with a string message'}), 400
         message = data.get('message', '').strip()
         
         if not message:
             return jsonify({'error': 'Message cannot be empty'}), 400
         
-        # Check if embeddings are available
-        if df is None:
+        course_id = data.get('course_id') or DEFAULT_COURSE_ID
+        fan_out = data.get('fan_out', False)
+        if not isinstance(course_id, str):
+            return jsonify({'error': 'course_id must be a string'}), 400
+        if not isinstance(fan_out, bool):
+            return jsonify({'error': 'fan_out must be true or false'}), 400
+        try:
+            shard_path(course_id)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Check if embeddings are available for the requested course
+        try:
+            if not fan_out:
+                shards.get(course_id)
+            elif not shards.available_courses():
+                raise FileNotFoundError("No course indices found")
+        except FileNotFoundError:
+            if course_id != DEFAULT_COURSE_ID:
+                return jsonify({'error': f"Unknown course: {course_id}"}), 404
             return jsonify({
                 'response': 'I apologize, but the AI tutor is currently unavailable. The knowledge base is not loaded. Please try again later or contact support.'
             })
         
+        # Wait for a slot, or shed the request right away if this client or the queue is over its limit.
+        # This happens before a session is created, so a rejected request never mints a new session id
+        try:
+            admitted_at = admission.acquire(client_key(data.get('session_id')))
+        except AdmissionRejected as e:
+            print(f"Shedding chat request: {e.reason}")
+            # Only a few shed requests may embed their question for a fallback answer at once
+            if e.reason != 'rate_limited' and ADMISSION_SHED_MODE == 'fallback' and fallback_slots.acquire(blocking=False):
+                try:
+                    session = sessions.get_or_create(data.get('session_id'), course_id)
+                    response = process_query(message, course_id, fan_out, session, retrieval_only=True)
+                    return jsonify({'response': response, 'session_id': session.session_id, 'degraded': True})
+                except Exception as fallback_error:
+                    print(f"Fallback answer failed, shedding instead: {fallback_error}")
+                finally:
+                    fallback_slots.release()
+            return rate_limited('The tutor is busy right now. Please try again shortly.', e.retry_after, reason=e.reason)
+        
         # Process the query
-        response = process_query(message)
+        try:
+            session = sessions.get_or_create(data.get('session_id'), course_id)
+            response = process_query(message, course_id, fan_out, session)
+        finally:
+            admission.release(admitted_at)
         
-        return jsonify({'response': response})
+        return jsonify({'response': response, 'session_id': session.session_id})
         
     except Exception as e:
         print(f"Error in chat endpoint: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/suggest')
+def suggest():
+    """Return typeahead question suggestions for a partially typed message."""
+    try:
+        prefix = request.args.get('q', '')[:200]
+        course_id = request.args.get('course_id') or DEFAULT_COURSE_ID
+        limit = max(1, min(int(request.args.get('limit', 5)), 10))
+        suggestions = get_suggestion_index(course_id).suggest(prefix, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    response = jsonify({'suggestions': suggestions})
+    # Suggestions only change when the index is rebuilt, so let the browser reuse them
+    response.headers['Cache-Control'] = 'public, max-age=300'
+    return response
+
 @app.route('/api/health')
 def health():
     """Health check endpoint."""
@@ -249,7 +482,7 @@ def health():
         # Don't try to load embeddings in health check to avoid blocking
         return jsonify({
             'status': 'healthy', 
-            'embeddings_loaded': df is not None,
+            'embeddings_loaded': bool(shards.resident_courses()),
             'message': 'Service is running'
         })
     except Exception as e:
@@ -261,6 +494,14 @@ def health():
             'message': 'Service is running with limited functionality'
         })
 
+# Gunicorn workers import this module without running __main__, so load the index here
+if __name__ != '__main__':
+    try:
+        load_embeddings()
+    except Exception as e:
+        print(f"⚠️  Warning: Could not load embeddings: {e}")
+        print("App will start without embeddings - some features may not work")
+
 if __name__ == '__main__':
     print("=== Starting RAG-based AI Application ===")
     print(f"🔍 Environment PORT: {os.getenv('PORT', 'Not set')}")
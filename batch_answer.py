@@ -0,0 +1,266 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from openai import OpenAI
+from dotenv import load_dotenv
+from rag_index import load_index, shard_path, DEFAULT_COURSE_ID, LEGACY_INDEX_FILE, METADATA_FIELDS, EMBEDDING_DIMENSIONS
+
+# Load environment variables
+load_dotenv()
+
+# Initialize OpenAI client
+client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+
+
+def create_embedding(text_list, max_retries=3):
+    """Create embeddings using OpenAI API with error handling and retry logic."""
+    for attempt in range(max_retries):
+        try:
+            response = client.embeddings.create(
+                model=os.getenv('OPENAI_EMBEDDING_MODEL', 'text-embedding-3-small'),
+                input=text_list,
+                dimensions=EMBEDDING_DIMENSIONS
+            )
+            return [data.embedding for data in response.data]
+
+        except Exception as e:
+            print(f"Error creating embeddings (attempt {attempt + 1}): {e}")
+            if attempt == max_retries - 1:
+                raise Exception("All retry attempts failed. Please check your OpenAI API key and try again.")
+            time.sleep(2)  # Wait before retry
+
+
+def inference(prompt, system_prompt, max_retries=3):
+    """Generate response using OpenAI API with error handling and retry logic."""
+    for attempt in range(max_retries):
+        try:
+            response = client.chat.completions.create(
+                model=os.getenv('OPENAI_CHAT_MODEL', 'gpt-3.5-turbo'),
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=int(os.getenv('OPENAI_MAX_TOKENS', 1000)),
+                temperature=float(os.getenv('OPENAI_TEMPERATURE', 0.7))
+            )
+            return response.choices[0].message.content
+
+        except Exception as e:
+            print(f"Error generating response (attempt {attempt + 1}): {e}")
+            if attempt == max_retries - 1:
+                raise Exception("All retry attempts failed. Please check your OpenAI API key and try again.")
+            time.sleep(2)  # Wait before retry
+
+
+def create_fallback_response(chunks, query):
+    """Create a simple fallback response when the generation API is unavailable."""
+    response_parts = [f"Based on your question '{query}', I found the following relevant video content:\n"]
+    for chunk in chunks:
+        start_time = int(chunk['start'])
+        end_time = int(chunk['end'])
+        response_parts.append(f"📹 {chunk['title']}")
+        response_parts.append(f"   Time: {start_time//60}:{start_time%60:02d} - {end_time//60}:{end_time%60:02d}")
+        response_parts.append(f"   Content: {chunk['text']}")
+        response_parts.append("")
+    response_parts.append("Note: This is a simplified response. For a more detailed answer, please ensure the generation API is working properly.")
+    return "\n".join(response_parts)
+
+
+def build_prompt(chunks, query, course):
+    """Build the tutor prompt for a question and its retrieved chunks."""
+    return f'''I am teaching my {course['name']} course. Here are video subtitle chunks containing video title, video number, start time in seconds, end time in seconds, the text at that time:
+
+{json.dumps([{field: chunk[field] for field in METADATA_FIELDS} for chunk in chunks], indent=2)}
+---------------------------------
+"{query}"
+User asked this question related to the video chunks, you have to answer in a human way (dont mention the above format, its just for you) where and how much content is taught in which video (in which video and at what timestamp) and guide the user to go to that particular video. If user asks unrelated question, tell him that you can only answer questions related to the course
+'''
+
+
+def read_questions(path):
+    """Read questions from a JSONL file, giving each one a stable id.
+
+    Lines without an id get 'line-<n>'; a repeated id is skipped, since resuming could only ever
+    keep one answer for it.
+    """
+    questions = []
+    seen = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Warning: Skipping invalid JSON on line {line_number}: {e}")
+                continue
+            if not isinstance(item, dict):
+                print(f"Warning: Line {line_number} is not a JSON object, skipping...")
+                continue
+            text = item.get('question') or item.get('message') or item.get('title')
+            if not isinstance(text, str) or not text.strip():
+                print(f"Warning: No question on line {line_number}, skipping...")
+                continue
+            # Checked against None so an id of 0 is kept instead of falling back to the line number
+            question_id = next((item[key] for key in ('id', 'request_id') if item.get(key) is not None), None)
+            question_id = f"line-{line_number}" if question_id is None else str(question_id)
+            if question_id in seen:
+                print(f"Warning: Duplicate id {question_id!r} on line {line_number}, skipping...")
+                continue
+            seen.add(question_id)
+            questions.append({'id': question_id, 'question': text.strip()})
+    return questions
+
+
+def read_completed_ids(path):
+    """Return the ids already answered in an existing output file, so a restart can resume."""
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                completed.add(json.loads(line)['id'])
+            except (json.JSONDecodeError, KeyError):
+                # A partially written last line from an interrupted run is answered again
+                continue
+    return completed
+
+
+def answer_question(item, chunks, course, system_prompt):
+    """Answer one question from its retrieved chunks and return the output record."""
+    start = time.perf_counter()
+    try:
+        response = inference(build_prompt(chunks, item['question'], course), system_prompt)
+        outcome = 'answered'
+    except Exception as e:
+        print(f"API error for {item['id']}: {e}")
+        response = create_fallback_response(chunks, item['question'])
+        outcome = 'fallback'
+    return {
+        'id': item['id'],
+        'question': item['question'],
+        'response': response,
+        'outcome': outcome,
+        'chunks': [{key: chunk[key] for key in ('title', 'number', 'start', 'end', 'score')} for chunk in chunks],
+        'latency_seconds': round(time.perf_counter() - start, 3)
+    }
+
+
+def run_pending(pending, index, course, system_prompt, args, executor, in_flight, out, started):
+    """Embed, search and answer the pending questions, writing each answer as it finishes.
+
+    `in_flight` is updated in place so the caller can still see the outstanding calls on Ctrl-C.
+    """
+    answered = 0
+    concurrency = max(1, args.concurrency)
+    batch_starts = iter(range(0, len(pending), args.batch_size))
+    while True:
+        # Embed and submit the next batch as soon as the executor has no more queued work than
+        # it has threads, so the pool stays full across batch boundaries
+        while len(in_flight) <= concurrency:
+            batch_start = next(batch_starts, None)
+            if batch_start is None:
+                break
+            batch = pending[batch_start:batch_start + args.batch_size]
+
+            # One embedding call and one matrix product for the whole batch
+            embeddings = create_embedding([item['question'] for item in batch])
+            indices, scores = index.search_batch(embeddings, args.top_k)
+
+            for item, rows, row_scores in zip(batch, indices, scores):
+                chunks = [
+                    dict(record, score=float(score))
+                    for record, score in zip(index.get_records(rows), row_scores)
+                ]
+                in_flight.add(executor.submit(answer_question, item, chunks, course, system_prompt))
+        if not in_flight:
+            return answered
+
+        # Results are written as they finish so an interrupted run loses at most the calls in flight
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            out.write(json.dumps(future.result(), ensure_ascii=False) + "\n")
+            out.flush()
+            in_flight.discard(future)
+            answered += 1
+            if answered % args.batch_size == 0 or answered == len(pending):
+                elapsed = time.perf_counter() - started
+                print(f"Answered {answered}/{len(pending)} ({answered / elapsed * 60:.1f} questions/min)")
+
+
+def parse_args():
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions in batch.")
+    parser.add_argument('input', help="JSONL file with one {\"id\", \"question\"} object per line")
+    parser.add_argument('output', help="JSONL file to append answers to (resumes if it already exists)")
+    parser.add_argument('--course', default=DEFAULT_COURSE_ID, help="Course id to answer from")
+    parser.add_argument('--batch-size', type=int, default=100, help="Questions embedded per API call")
+    parser.add_argument('--concurrency', type=int, default=8, help="Maximum LLM calls in flight")
+    parser.add_argument('--top-k', type=int, default=5, help="Chunks retrieved per question")
+    return parser.parse_args()
+
+
+def main():
+    """Main function to answer a batch of questions."""
+    args = parse_args()
+    try:
+        legacy_path = LEGACY_INDEX_FILE if args.course == DEFAULT_COURSE_ID else None
+        index = load_index(shard_path(args.course), legacy_path)
+        course = index.course
+        system_prompt = f"You are a helpful tutor for the {course['name']} course. Answer questions about {course['description']} based on the provided video content."
+        print(f"Loaded {len(index)} embeddings for course '{args.course}'")
+
+        questions = read_questions(args.input)
+        completed = read_completed_ids(args.output)
+        pending = [item for item in questions if item['id'] not in completed]
+        print(f"Found {len(questions)} questions, {len(completed)} already answered, {len(pending)} to go")
+        if not pending:
+            return
+
+        # Terminate a partially written last line from an interrupted run before appending
+        if os.path.exists(args.output) and os.path.getsize(args.output) > 0:
+            with open(args.output, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b"\n"
+            if needs_newline:
+                with open(args.output, 'a', encoding='utf-8') as f:
+                    f.write("\n")
+
+        started = time.perf_counter()
+        in_flight = set()
+        executor = ThreadPoolExecutor(max_workers=max(1, args.concurrency))
+        try:
+            with open(args.output, 'a', encoding='utf-8') as out:
+                try:
+                    answered = run_pending(pending, index, course, system_prompt, args, executor, in_flight, out, started)
+                except KeyboardInterrupt:
+                    # Drop the queued calls, but keep the answers of calls already running since they are paid for
+                    cancelled = sum(future.cancel() for future in in_flight)
+                    running = [future for future in in_flight if not future.cancelled()]
+                    print(f"\nCancelled {cancelled} queued questions, saving {len(running)} answers in flight "
+                          f"(press Ctrl-C again to discard them)...")
+                    for future in running:
+                        out.write(json.dumps(future.result(), ensure_ascii=False) + "\n")
+                        out.flush()
+                    raise
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        elapsed = time.perf_counter() - started
+        print(f"\nCompleted {answered} questions in {elapsed:.1f}s ({answered / elapsed * 60:.1f} questions/min)")
+        print(f"Results saved to {args.output}")
+
+    except KeyboardInterrupt:
+        print("\nOperation cancelled by user. Re-run the same command to resume.")
+        sys.exit(0)
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
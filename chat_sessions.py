@@ -0,0 +1,156 @@
+import hashlib
+import hmac
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+# Short questions that point back at the previous answer ("why was the value of x that")
+FOLLOW_UP_PATTERN = re.compile(r"\b(it|its|that|this|those|these|them|again|more|above|previous|same)\b", re.IGNORECASE)
+FOLLOW_UP_MAX_WORDS = 12
+SESSION_ID_PATTERN = re.compile(r'^[0-9a-f]{32}\.[0-9a-f]{24}$')
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+# Words that carry no topic; anything else in a follow-up must already appear in the previous turn
+STOPWORDS = set("""
+a about above after again all also am an and any are as at be because been before being between both but by can could
+did do does doing explain for from had has have how i if in into is it its just me more my no not of on or our over
+please previous same should so some such tell than that the their them then there these they this those to too under
+was we were what when where which while who why will with would you your
+""".split())
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def content_words(text):
+    """Return the topic words of a text, lowercased and with a plural 's' stripped."""
+    words = set()
+    for word in WORD_PATTERN.findall(text.lower()):
+        if word in STOPWORDS or (len(word) < 3 and not word.isdigit()):
+            continue
+        words.add(word[:-1] if len(word) > 3 and word.endswith('s') else word)
+    return words
+
+
+def refers_back(query):
+    """Return True if a short query points at the previous turn ("it", "that", "more", ...)."""
+    return len(query.split()) <= FOLLOW_UP_MAX_WORDS and bool(FOLLOW_UP_PATTERN.search(query))
+
+
+def is_follow_up(query, context_words):
+    """Return True if a query refers back and every topic word in it was already covered by the previous turn.
+
+    "why was the value of x that" qualifies; "explain more about circles" after a turn about triangles
+    does not, because "circles" needs a fresh search.
+    """
+    return refers_back(query) and content_words(query) <= context_words
+
+
+class ChatSession:
+    """Recent turns of one conversation and the chunks retrieved for them."""
+
+    def __init__(self, session_id, course_id, max_turns):
+        self.session_id = session_id
+        self.course_id = course_id
+        self.turns = deque(maxlen=max_turns)
+        self.last_access = time.time()
+
+    def last_chunks(self):
+        """Return the (course_id, row, score) refs retrieved for the previous turn."""
+        return self.turns[-1]['chunks'] if self.turns else []
+
+    def last_context_words(self):
+        """Return the topic words of the previous question and the chunks it was answered from."""
+        return self.turns[-1]['context_words'] if self.turns else set()
+
+    def add_turn(self, query, response, chunks):
+        """Record a finished turn with references to the chunks it was answered from."""
+        self.turns.append({
+            'query': query,
+            'response': response,
+            'chunks': [(chunk['course_id'], chunk['row'], chunk['score']) for chunk in chunks],
+            'context_words': content_words(' '.join([query] + [chunk['text'] for chunk in chunks]))
+        })
+
+    def history_messages(self, token_budget):
+        """Return the most recent turns as chat messages, oldest first, within a token budget."""
+        messages = []
+        used = 0
+        for turn in reversed(self.turns):
+            cost = estimate_tokens(turn['query']) + estimate_tokens(turn['response'])
+            if used + cost > token_budget:
+                break
+            used += cost
+            messages[:0] = [
+                {"role": "user", "content": turn['query']},
+                {"role": "assistant", "content": turn['response']}
+            ]
+        return messages
+
+
+class SessionStore:
+    """Bounded in-memory session store with TTL and least-recently-used eviction."""
+
+    def __init__(self, max_sessions=1000, ttl_seconds=1800, max_turns=6, secret=None):
+        self.max_sessions = max(1, max_sessions)
+        self.ttl_seconds = ttl_seconds
+        self.max_turns = max_turns
+        # Ids are signed so every worker sharing the secret can tell issued ids from made-up ones
+        self._secret = secret or os.urandom(32)
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def issue_id(self):
+        """Return a new signed session id."""
+        token = uuid.uuid4().hex
+        return f"{token}.{self._sign(token)}"
+
+    def is_issued(self, session_id):
+        """Return True if a session id was issued with this store's secret."""
+        if not isinstance(session_id, str) or not SESSION_ID_PATTERN.match(session_id):
+            return False
+        token, signature = session_id.split('.')
+        return hmac.compare_digest(signature, self._sign(token))
+
+    def _sign(self, token):
+        return hmac.new(self._secret, token.encode('ascii'), hashlib.sha256).hexdigest()[:24]
+
+    def get_or_create(self, session_id, course_id):
+        """Return the live session for an id, or start a new one if it is unknown, expired or for another course.
+
+        A correctly signed id that this store does not hold (issued by another worker, or expired)
+        starts a fresh conversation under the same id; any other id is replaced by a newly issued one.
+        """
+        now = time.time()
+        issued = self.is_issued(session_id)
+        with self._lock:
+            self._evict_expired(now)
+            session = self._sessions.get(session_id) if issued else None
+            if session is None:
+                session = ChatSession(session_id if issued else self.issue_id(), course_id, self.max_turns)
+                self._sessions[session.session_id] = session
+            elif session.course_id != course_id:
+                # Same student switching course: keep the id, start a fresh conversation
+                session = ChatSession(session.session_id, course_id, self.max_turns)
+                self._sessions[session.session_id] = session
+            session.last_access = now
+            self._sessions.move_to_end(session.session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session
+
+    def _evict_expired(self, now):
+        # Sessions are kept in access order, so expired ones are always at the front
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_access <= self.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
@@ -0,0 +1,207 @@
+import argparse
+import base64
+import hashlib
+import json
+import random
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the OpenAI API used by load_test.py.
+# Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1
+
+
+class FakeOpenAIConfig:
+    """Latency, error and streaming behaviour of the fake upstream."""
+
+    def __init__(self, latency_ms=500, jitter_ms=100, embedding_latency_ms=50,
+                 error_rate=0.0, stream_chunks=20, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.embedding_latency_ms = embedding_latency_ms
+        self.error_rate = error_rate
+        self.stream_chunks = stream_chunks
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {'embeddings': 0, 'chat': 0, 'errors': 0}
+
+    def delay(self, base_ms):
+        """Sleep for the configured latency plus uniform jitter."""
+        with self.lock:
+            jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        time.sleep(max(0.0, base_ms + jitter) / 1000)
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+
+def fake_embedding(text, dimensions):
+    """Deterministic pseudo-embedding so the same text always maps to the same vector."""
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+    rng = random.Random(seed)
+    return [rng.gauss(0, 1) for _ in range(dimensions)]
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Implements /v1/embeddings and /v1/chat/completions (plain and streaming)."""
+
+    config = FakeOpenAIConfig()
+
+    def log_message(self, format, *args):
+        # Per-request access logs would dominate the load test output
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self._send_json(400, {'error': {'message': 'Invalid JSON body', 'type': 'invalid_request_error'}})
+            return
+
+        if self.path.endswith('/embeddings'):
+            self._embeddings(body)
+        elif self.path.endswith('/chat/completions'):
+            self._chat(body)
+        else:
+            self._send_json(404, {'error': {'message': f'Unknown path {self.path}', 'type': 'invalid_request_error'}})
+
+    def _fail_if_configured(self):
+        if self.config.should_fail():
+            self.config.count('errors')
+            self._send_json(500, {'error': {'message': 'Injected upstream error', 'type': 'server_error'}})
+            return True
+        return False
+
+    def _embeddings(self, body):
+        self.config.count('embeddings')
+        self.config.delay(self.config.embedding_latency_ms)
+        if self._fail_if_configured():
+            return
+
+        inputs = body.get('input', [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimensions = int(body.get('dimensions') or 1536)
+        data = []
+        for i, text in enumerate(inputs):
+            vector = fake_embedding(str(text), dimensions)
+            if body.get('encoding_format') == 'base64':
+                vector = base64.b64encode(struct.pack(f'<{dimensions}f', *vector)).decode('ascii')
+            data.append({'object': 'embedding', 'index': i, 'embedding': vector})
+        tokens = sum(len(str(text).split()) for text in inputs)
+        self._send_json(200, {
+            'object': 'list',
+            'data': data,
+            'model': body.get('model', 'fake-embedding'),
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}
+        })
+
+    def _chat(self, body):
+        self.config.count('chat')
+        if body.get('stream'):
+            # Time to first token is a fraction of the latency, the rest is spread over the chunks
+            self.config.delay(self.config.latency_ms * 0.2)
+            if self._fail_if_configured():
+                return
+            self._stream_chat(body)
+            return
+
+        self.config.delay(self.config.latency_ms)
+        if self._fail_if_configured():
+            return
+        self._send_json(200, {
+            'id': 'chatcmpl-fake',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'fake-chat'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': self._answer(body)},
+                'finish_reason': 'stop'
+            }],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+        })
+
+    def _stream_chat(self, body):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        words = self._answer(body).split(' ')
+        chunk_count = max(1, self.config.stream_chunks)
+        per_chunk = max(1, len(words) // chunk_count)
+        chunk_delay_ms = self.config.latency_ms * 0.8 / chunk_count
+        for start in range(0, len(words), per_chunk):
+            self.config.delay(chunk_delay_ms)
+            event = {
+                'id': 'chatcmpl-fake',
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': body.get('model', 'fake-chat'),
+                'choices': [{'index': 0, 'delta': {'content': ' '.join(words[start:start + per_chunk]) + ' '}, 'finish_reason': None}]
+            }
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    @staticmethod
+    def _answer(body):
+        messages = body.get('messages') or [{}]
+        question = str(messages[-1].get('content', ''))[-200:]
+        return f"This is a stub answer from the fake upstream. Please watch the first video at 1:05. Question tail: {question}"
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def create_server(port, config):
+    """Create (but do not start) a fake OpenAI server bound to 127.0.0.1."""
+    handler = type('ConfiguredFakeOpenAIHandler', (FakeOpenAIHandler,), {'config': config})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def parse_args():
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Run a local fake OpenAI API for load testing.")
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency-ms', type=float, default=500, help="Chat completion latency")
+    parser.add_argument('--jitter-ms', type=float, default=100, help="Uniform +/- jitter added to every call")
+    parser.add_argument('--embedding-latency-ms', type=float, default=50)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of calls answered with HTTP 500")
+    parser.add_argument('--stream-chunks', type=int, default=20, help="Chunks per streamed chat completion")
+    parser.add_argument('--seed', type=int, default=None)
+    return parser.parse_args()
+
+
+def main():
+    """Main function to run the fake upstream until interrupted."""
+    args = parse_args()
+    config = FakeOpenAIConfig(args.latency_ms, args.jitter_ms, args.embedding_latency_ms,
+                              args.error_rate, args.stream_chunks, args.seed)
+    server = create_server(args.port, config)
+    print(f"Fake OpenAI API listening on http://127.0.0.1:{args.port}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\nStopped. Calls served: {config.counts}")
+        sys.exit(0)
+
+if __name__ == "__main__":
+    main()
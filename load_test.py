@@ -0,0 +1,395 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+QUESTIONS = [
+    "What is transformation?",
+    "Explain similar triangles",
+    "How do I reflect over y=x?",
+    "What are intersecting chords?",
+    "How do you rotate a point about another point?",
+    "What is the triangle proportionality theorem?",
+    "How do I find the angle between a tangent and a chord?",
+    "How do I compose two transformations?",
+]
+
+# Marker text of create_fallback_response in app_minimal.py
+FALLBACK_MARKER = "This is a simplified response"
+
+
+def free_port():
+    """Return a free TCP port on localhost."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def build_synthetic_index(directory, chunks, dimensions=1024):
+    """Write a random embeddings.npz so the app can be load tested without a real corpus."""
+    import numpy as np
+    from rag_index import save_index
+    rng = np.random.default_rng(0)
+    records = [{
+        'title': f"Synthetic video {i // 100}",
+        'number': i % 100 + 1,
+        'start': float(i % 100) * 3,
+        'end': float(i % 100) * 3 + 3,
+        'text': f"Synthetic transcript chunk {i}",
+        'chunk_id': i
+    } for i in range(chunks)]
+    save_index(records, rng.normal(size=(chunks, dimensions)), os.path.join(directory, 'embeddings.npz'))
+
+
+def wait_for_health(url, timeout):
+    """Poll the health endpoint until it answers or the timeout expires."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            pass
+        time.sleep(0.25)
+    return False
+
+
+def worker_pids(master_pid):
+    """Return the pids of the gunicorn workers forked by the master (Linux /proc)."""
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces, so split after the closing parenthesis
+                fields = f.read().rsplit(')', 1)[1].split()
+            if int(fields[1]) == master_pid:
+                pids.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return sorted(pids)
+
+
+def read_proc_stats(pid):
+    """Return (cpu_seconds, rss_mb) for a process, or None if it has exited."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        with open(f'/proc/{pid}/status') as f:
+            rss_kb = next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+        return cpu_seconds, rss_kb / 1024
+    except (OSError, IndexError, ValueError, StopIteration):
+        return None
+
+
+class WorkerSampler(threading.Thread):
+    """Samples CPU time and RSS of every gunicorn worker in the background."""
+
+    def __init__(self, master_pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.master_pid = master_pid
+        self.interval = interval
+        self.stats = {}
+        self.peak_rss = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(self.interval)
+
+    def sample(self):
+        for pid in worker_pids(self.master_pid):
+            stats = read_proc_stats(pid)
+            if stats is None:
+                continue
+            with self.lock:
+                self.stats[pid] = stats
+                self.peak_rss[pid] = max(self.peak_rss.get(pid, 0), stats[1])
+
+    def snapshot(self):
+        """Return {pid: (cpu_seconds, rss_mb)} and reset the per-step RSS peaks."""
+        self.sample()
+        with self.lock:
+            snapshot = dict(self.stats)
+            peaks = dict(self.peak_rss)
+            self.peak_rss = {pid: stats[1] for pid, stats in snapshot.items()}
+        return snapshot, peaks
+
+    def stop(self):
+        self.stopped.set()
+
+
+def start_session(base_url):
+    """Ask the app for a session id the way the web page does on load; None if it is refused."""
+    request = urllib.request.Request(f'{base_url}/api/session', data=b'', method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return json.loads(response.read())['session_id']
+    except (urllib.error.URLError, ConnectionError, OSError, ValueError, KeyError):
+        return None
+
+
+def send_chat(url, message, timeout, session_id=None):
+    """POST one question to /api/chat in a given session (or none) and return (outcome, status_code)."""
+    payload = {'message': message}
+    if session_id:
+        payload['session_id'] = session_id
+    data = json.dumps(payload).encode('utf-8')
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            body = json.loads(response.read() or b'{}')
+            if FALLBACK_MARKER in body.get('response', ''):
+                return 'fallback', response.status
+            return 'ok', response.status
+    except urllib.error.HTTPError as e:
+        # 429 is admission control shedding the request, not a failure
+        return ('shed' if e.code == 429 else 'error'), e.code
+    except (socket.timeout, TimeoutError):
+        return 'timeout', None
+    except urllib.error.URLError as e:
+        if isinstance(e.reason, (socket.timeout, TimeoutError)):
+            return 'timeout', None
+        return 'error', None
+    except (ConnectionError, OSError):
+        return 'error', None
+
+
+def run_step(url, rate, duration, timeout, poisson=False, session_ids=(None,), anonymous_fraction=0.0):
+    """Drive the app open-loop at a fixed arrival rate and return the raw results.
+
+    Requests are sent on schedule whether or not earlier ones have finished, and latency is
+    measured from the scheduled send time so queueing in the client is not hidden. Each request
+    belongs to a random student's session; `anonymous_fraction` of them carry no session at all,
+    like first messages from a class behind one NAT address (every request here comes from 127.0.0.1).
+    """
+    results = []
+    lock = threading.Lock()
+    threads = []
+    rng = random.Random(rate)
+
+    def fire(scheduled, message, session_id):
+        outcome, status = send_chat(url, message, timeout, session_id)
+        with lock:
+            results.append({
+                'outcome': outcome,
+                'status': status,
+                'anonymous': session_id is None,
+                'latency': time.perf_counter() - scheduled
+            })
+
+    start = time.perf_counter()
+    scheduled = start
+    while scheduled < start + duration:
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        session_id = None if rng.random() < anonymous_fraction else rng.choice(session_ids)
+        thread = threading.Thread(target=fire, args=(scheduled, rng.choice(QUESTIONS), session_id), daemon=True)
+        thread.start()
+        threads.append(thread)
+        scheduled += rng.expovariate(rate) if poisson else 1.0 / rate
+
+    for thread in threads:
+        thread.join(timeout + 5)
+    return results, time.perf_counter() - start
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+
+def summarize(rate, results, elapsed, before, after, peaks):
+    """Aggregate one step into throughput, latency percentiles, outcomes and worker usage."""
+    latencies = [r['latency'] for r in results if r['outcome'] in ('ok', 'fallback')]
+    outcomes = {}
+    for r in results:
+        outcomes[r['outcome']] = outcomes.get(r['outcome'], 0) + 1
+    workers = []
+    for pid, (cpu_seconds, rss_mb) in sorted(after.items()):
+        cpu_before = before.get(pid, (cpu_seconds, 0))[0]
+        workers.append({
+            'pid': pid,
+            'cpu_percent': round((cpu_seconds - cpu_before) / elapsed * 100, 1),
+            'rss_mb': round(rss_mb, 1),
+            'peak_rss_mb': round(peaks.get(pid, rss_mb), 1)
+        })
+    return {
+        'target_rps': rate,
+        'sent': len(results),
+        'throughput_rps': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000) if latencies else None,
+        'ok': outcomes.get('ok', 0),
+        'fallback': outcomes.get('fallback', 0),
+        'shed': outcomes.get('shed', 0),
+        'anonymous_sent': sum(1 for r in results if r['anonymous']),
+        'anonymous_shed': sum(1 for r in results if r['anonymous'] and r['outcome'] == 'shed'),
+        'errors': outcomes.get('error', 0),
+        'timeouts': outcomes.get('timeout', 0),
+        'workers': workers
+    }
+
+
+def print_report(steps):
+    """Print one row per request rate plus per-worker usage."""
+    print("\n" + "="*103)
+    print(f"{'rate':>6} {'sent':>6} {'thru/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ok':>6} {'fallbk':>6} {'shed':>6} {'errors':>6} {'timeout':>7}  workers (cpu%/rss MB)")
+    print("="*103)
+    for step in steps:
+        workers = ', '.join(f"{w['cpu_percent']}%/{w['peak_rss_mb']}" for w in step['workers'])
+        print(f"{step['target_rps']:>6} {step['sent']:>6} {step['throughput_rps']:>7} "
+              f"{str(step['p50_ms']):>8} {str(step['p95_ms']):>8} {str(step['p99_ms']):>8} "
+              f"{step['ok']:>6} {step['fallback']:>6} {step['shed']:>6} {step['errors']:>6} {step['timeouts']:>7}  {workers}")
+    print("="*103)
+
+
+def parse_args():
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Load test app_minimal under gunicorn against a fake OpenAI upstream.")
+    parser.add_argument('--rates', default='1,2,5,10', help="Comma-separated request rates (req/s), one step each")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds per rate step")
+    parser.add_argument('--poisson', action='store_true', help="Use Poisson arrivals instead of a fixed interval")
+    parser.add_argument('--students', type=int, default=50, help="Simulated students the requests are spread over")
+    parser.add_argument('--anonymous-fraction', type=float, default=0.0,
+                        help="Fraction of requests sent without a session (first messages behind one address)")
+    parser.add_argument('--request-timeout', type=float, default=130, help="Client-side timeout per request")
+    parser.add_argument('--workers', type=int, default=2, help="Gunicorn workers")
+    parser.add_argument('--gunicorn-timeout', type=int, default=120, help="Gunicorn worker timeout")
+    parser.add_argument('--gunicorn-args', default='--threads 16', help="Extra gunicorn arguments (default matches the Procfile)")
+    parser.add_argument('--latency-ms', type=float, default=1500, help="Fake chat completion latency")
+    parser.add_argument('--jitter-ms', type=float, default=300)
+    parser.add_argument('--embedding-latency-ms', type=float, default=80)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of fake upstream calls that fail")
+    parser.add_argument('--stream-chunks', type=int, default=20)
+    parser.add_argument('--index-dir', default=None,
+                        help="Directory containing embeddings.npz (default: a synthetic index in a temp dir)")
+    parser.add_argument('--synthetic-chunks', type=int, default=2000)
+    parser.add_argument('--json', dest='json_output', default=None, help="Also write the report to this JSON file")
+    return parser.parse_args()
+
+
+def main():
+    """Main function to start the fake upstream and gunicorn, run the rate steps and report."""
+    args = parse_args()
+    rates = [float(rate) for rate in args.rates.split(',') if rate.strip()]
+    work_dir = tempfile.mkdtemp(prefix='rag_load_test_')
+    processes = []
+    sampler = None
+    try:
+        index_dir = args.index_dir
+        if index_dir is None:
+            print(f"Building synthetic index with {args.synthetic_chunks} chunks in {work_dir}...")
+            build_synthetic_index(work_dir, args.synthetic_chunks)
+            index_dir = work_dir
+
+        fake_port = free_port()
+        fake = subprocess.Popen([
+            sys.executable, os.path.join(REPO_DIR, 'fake_openai.py'),
+            '--port', str(fake_port),
+            '--latency-ms', str(args.latency_ms),
+            '--jitter-ms', str(args.jitter_ms),
+            '--embedding-latency-ms', str(args.embedding_latency_ms),
+            '--error-rate', str(args.error_rate),
+            '--stream-chunks', str(args.stream_chunks)
+        ], stdout=subprocess.DEVNULL)
+        processes.append(fake)
+
+        app_port = free_port()
+        env = dict(os.environ)
+        env.update({
+            'OPENAI_API_KEY': 'fake-key',
+            'OPENAI_BASE_URL': f'http://127.0.0.1:{fake_port}/v1',
+            'PORT': str(app_port)
+        })
+        # Every simulated student starts a session from 127.0.0.1, like a class behind one NAT
+        env.setdefault('SESSION_ISSUE_BURST', str(max(60, args.students)))
+        log_path = os.path.join(work_dir, 'gunicorn.log')
+        with open(log_path, 'w') as log:
+            gunicorn = subprocess.Popen([
+                sys.executable, '-m', 'gunicorn',
+                '--bind', f'127.0.0.1:{app_port}',
+                '--workers', str(args.workers),
+                '--timeout', str(args.gunicorn_timeout),
+                '--chdir', os.path.abspath(index_dir),
+                '--pythonpath', REPO_DIR,
+                *args.gunicorn_args.split(),
+                'app_minimal:app'
+            ], env=env, stdout=log, stderr=subprocess.STDOUT)
+        processes.append(gunicorn)
+
+        base_url = f'http://127.0.0.1:{app_port}'
+        print(f"Starting gunicorn with {args.workers} workers on {base_url}...")
+        if not wait_for_health(f'{base_url}/api/health', timeout=60):
+            print("Error: app did not become healthy. Last lines of the gunicorn log:")
+            with open(log_path) as log:
+                print(''.join(log.readlines()[-20:]))
+            sys.exit(1)
+
+        session_ids = [start_session(base_url) for _ in range(args.students)]
+        issued = sum(1 for session_id in session_ids if session_id)
+        print(f"Started {issued} of {args.students} student sessions")
+
+        sampler = WorkerSampler(gunicorn.pid)
+        sampler.start()
+
+        steps = []
+        for rate in rates:
+            print(f"Running {rate} req/s for {args.duration:.0f}s...")
+            before, _ = sampler.snapshot()
+            results, elapsed = run_step(f'{base_url}/api/chat', rate, args.duration, args.request_timeout,
+                                        args.poisson, session_ids, args.anonymous_fraction)
+            after, peaks = sampler.snapshot()
+            step = summarize(rate, results, elapsed, before, after, peaks)
+            steps.append(step)
+            print(f"  p50 {step['p50_ms']} ms, p99 {step['p99_ms']} ms, {step['shed']} shed "
+                  f"({step['anonymous_shed']} of {step['anonymous_sent']} without a session), "
+                  f"{step['errors']} errors, {step['timeouts']} timeouts")
+
+        print_report(steps)
+        if args.json_output:
+            with open(args.json_output, 'w', encoding='utf-8') as f:
+                json.dump({'config': vars(args), 'steps': steps}, f, indent=2)
+            print(f"Report saved to {args.json_output}")
+
+    except KeyboardInterrupt:
+        print("\nOperation cancelled by user.")
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        sys.exit(1)
+    finally:
+        if sampler:
+            sampler.stop()
+        for process in reversed(processes):
+            process.send_signal(signal.SIGTERM)
+        for process in processes:
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
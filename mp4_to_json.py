@@ -1,11 +1,22 @@
 import whisper
+import argparse
 import json
 import os
 import sys
+from transcript_store import write_transcript, STORE_DIR, STORE_EXTENSION
+
+
+def parse_args():
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Transcribe MP4 videos with Whisper.")
+    parser.add_argument('--format', choices=['store', 'json'], default='store',
+                        help="Write the compact transcript store (transcripts/) or legacy JSON (jsons/)")
+    return parser.parse_args()
 
 
 def main():
-    """Main function to transcribe MP4 videos and save as JSON."""
+    """Main function to transcribe MP4 videos and save the transcripts."""
+    args = parse_args()
     try:
         # Check if learning_videos directory exists
         if not os.path.exists("learning_videos"):
@@ -18,7 +29,8 @@ def main():
         print("Model loaded successfully")
 
         # Create output directory
-        os.makedirs("jsons", exist_ok=True)
+        output_dir = STORE_DIR if args.format == 'store' else "jsons"
+        os.makedirs(output_dir, exist_ok=True)
 
         # Get list of MP4 files
         audios = os.listdir("learning_videos")
@@ -52,17 +64,22 @@ def main():
                         "text": segment["text"]
                     })
 
-                # Create metadata
-                chunks_with_metadata = {
-                    "file": audio,
-                    "chunks": chunks,
-                    "full_text": result["text"]
-                }
+                if args.format == 'store':
+                    # Title is stored once per video; the full text is the concatenation of the segments
+                    output_file = os.path.join(output_dir, audio.replace('.mp4', STORE_EXTENSION))
+                    write_transcript(output_file, audio, audio.replace(".mp4", ""), chunks)
+                else:
+                    # Create metadata
+                    chunks_with_metadata = {
+                        "file": audio,
+                        "chunks": chunks,
+                        "full_text": result["text"]
+                    }
 
-                # Save to JSON
-                output_file = f"jsons/{audio.replace('.mp4', '.json')}"
-                with open(output_file, "w", encoding="utf-8") as f:
-                    json.dump(chunks_with_metadata, f, ensure_ascii=False, indent=2)
+                    # Save to JSON
+                    output_file = os.path.join(output_dir, audio.replace('.mp4', '.json'))
+                    with open(output_file, "w", encoding="utf-8") as f:
+                        json.dump(chunks_with_metadata, f, ensure_ascii=False, indent=2)
 
                 print(f"✅ Saved: {output_file}")
                 
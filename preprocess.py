@@ -1,13 +1,15 @@
 import os
 import json
+import argparse
 import pandas as pd
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 import joblib
 import sys
 import time
 from openai import OpenAI
 from dotenv import load_dotenv
+from rag_index import save_index, shard_path, DEFAULT_COURSE, DEFAULT_COURSE_ID, EMBEDDING_DIMENSIONS
+from transcript_store import iter_transcript_files, transcript_source, STORE_DIR
 
 # Load environment variables
 load_dotenv()
@@ -25,7 +27,8 @@ def create_embedding(text_list, max_retries=3):
             # Use OpenAI embeddings API
             response = client.embeddings.create(
                 model=os.getenv('OPENAI_EMBEDDING_MODEL', 'text-embedding-3-small'),
-                input=text_list
+                input=text_list,
+                dimensions=EMBEDDING_DIMENSIONS
             )
             
             # Extract embeddings from response
@@ -41,68 +44,99 @@ def create_embedding(text_list, max_retries=3):
             time.sleep(2)  # Wait before retry
 
 
+def parse_args():
+    """Parse command line options for building the default index or a course shard."""
+    parser = argparse.ArgumentParser(description="Create embeddings for video transcripts.")
+    parser.add_argument('--course', default=DEFAULT_COURSE_ID,
+                        help="Course id; non-default courses are written to their own shard in indices/")
+    parser.add_argument('--name', default=DEFAULT_COURSE['name'], help="Course name shown to the tutor")
+    parser.add_argument('--description', default=DEFAULT_COURSE['description'],
+                        help="Topics the course covers, used in the tutor's system prompt")
+    parser.add_argument('--transcripts-dir', default=None,
+                        help=f"Directory containing the compact transcript store (default: {STORE_DIR}/ when it has .seg files)")
+    parser.add_argument('--jsons-dir', default=None,
+                        help="Directory containing the JSON transcripts (default: jsons/ when there is no transcript store)")
+    parser.add_argument('--batch-size', type=int, default=256, help="Segments embedded per API call")
+    return parser.parse_args()
+
+
 def main():
-    """Main function to process JSON files and create embeddings."""
+    """Main function to stream transcripts through chunking and embedding."""
+    args = parse_args()
     try:
-        # Check if jsons directory exists
-        if not os.path.exists("jsons"):
-            print("Error: 'jsons' directory not found. Please run mp4_to_json.py first.")
-            sys.exit(1)
-            
-        jsons = os.listdir("jsons")  # List all the jsons
-        
-        if not jsons:
-            print("Error: No JSON files found in 'jsons' directory.")
+        course = {'course_id': args.course, 'name': args.name, 'description': args.description}
+        index_path = shard_path(args.course)
+
+        # Prefer the compact transcript store, fall back to the JSON transcripts
+        source_dir = transcript_source(args.transcripts_dir, args.jsons_dir)
+        if not os.path.exists(source_dir):
+            print(f"Error: '{source_dir}' directory not found. Please run mp4_to_json.py first.")
             sys.exit(1)
             
-        print(f"Found {len(jsons)} JSON files to process")
+        print(f"Reading transcripts from '{source_dir}'")
         
         my_dicts = []
+        embedding_batches = []
         chunk_id = 0
+        file_count = 0
 
-        for json_file in jsons:
-            if not json_file.endswith('.json'):
-                print(f"Skipping non-JSON file: {json_file}")
-                continue
-                
+        # Files are streamed one at a time and embedded in fixed-size batches instead of
+        # loading every transcript before the first embedding call
+        for transcript_file, segments in iter_transcript_files(source_dir):
             try:
-                with open(f"jsons/{json_file}", 'r', encoding='utf-8') as f:
-                    content = json.load(f)
-                    
-                if 'chunks' not in content:
-                    print(f"Warning: No 'chunks' found in {json_file}, skipping...")
-                    continue
-                    
-                print(f"Creating Embeddings for {json_file}")
-                embeddings = create_embedding([c['text'] for c in content['chunks']])
+                print(f"Creating Embeddings for {transcript_file}")
+                file_chunks = []
+                file_embeddings = []
+                batch = []
+                for segment in segments:
+                    batch.append(segment)
+                    if len(batch) == args.batch_size:
+                        file_embeddings.append(np.asarray(create_embedding([c['text'] for c in batch]), dtype=np.float32))
+                        file_chunks.extend(batch)
+                        batch = []
+                if batch:
+                    file_embeddings.append(np.asarray(create_embedding([c['text'] for c in batch]), dtype=np.float32))
+                    file_chunks.extend(batch)
                    
-                for i, chunk in enumerate(content['chunks']):
+                for chunk in file_chunks:
                     chunk['chunk_id'] = chunk_id
-                    chunk['embedding'] = embeddings[i]
                     chunk_id += 1
                     my_dicts.append(chunk)
+                embedding_batches.extend(file_embeddings)
+                file_count += 1
                     
             except json.JSONDecodeError as e:
-                print(f"Error: Invalid JSON in {json_file}: {e}")
+                print(f"Error: Invalid JSON in {transcript_file}: {e}")
                 continue
             except IOError as e:
-                print(f"Error reading {json_file}: {e}")
+                print(f"Error reading {transcript_file}: {e}")
                 continue
             except Exception as e:
-                print(f"Error processing {json_file}: {e}")
+                print(f"Error processing {transcript_file}: {e}")
                 continue
 
+        print(f"Processed {file_count} transcript files")
+        
         if not my_dicts:
             print("Error: No valid chunks found to process.")
             sys.exit(1)
+        
+        embeddings = np.vstack(embedding_batches)
+            
+        if args.course == DEFAULT_COURSE_ID:
+            print(f"Creating DataFrame with {len(my_dicts)} chunks...")
+            df = pd.DataFrame.from_records(my_dicts)
+            df['embedding'] = list(embeddings)
             
-        print(f"Creating DataFrame with {len(my_dicts)} chunks...")
-        df = pd.DataFrame.from_records(my_dicts)
+            # Save this dataframe 
+            print("Saving embeddings to embeddings.joblib...")
+            joblib.dump(df, "embeddings.joblib")
+            print(f"Successfully saved {len(df)} embeddings to embeddings.joblib")
         
-        # Save this dataframe 
-        print("Saving embeddings to embeddings.joblib...")
-        joblib.dump(df, "embeddings.joblib")
-        print(f"Successfully saved {len(df)} embeddings to embeddings.joblib")
+        # Save the pandas-free index (or course shard) used by the web app
+        print(f"Saving serving index to {index_path}...")
+        save_index(my_dicts, embeddings, index_path, course)
+        print(f"Successfully saved {len(my_dicts)} embeddings to {index_path}")
         
     except KeyboardInterrupt:
         print("\nOperation cancelled by user.")
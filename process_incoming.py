@@ -7,6 +7,7 @@ import sys
 import time
 from openai import OpenAI
 from dotenv import load_dotenv
+from query_journal import QueryJournal, DEFAULT_JOURNAL_PATH, encode_embedding
 
 # Load environment variables
 load_dotenv()
@@ -101,6 +102,11 @@ def main():
             print("Error: embeddings.joblib file not found. Please run preprocess.py first.")
             sys.exit(1)
             
+        # Queries are journaled from a background thread instead of rewriting prompt.txt/response.txt
+        # (set QUERY_JOURNAL_PATH= to disable, as in the web app)
+        journal_path = os.getenv('QUERY_JOURNAL_PATH', DEFAULT_JOURNAL_PATH)
+        journal = QueryJournal(journal_path) if journal_path else None
+        
         print("Loading embeddings...")
         df = joblib.load('embeddings.joblib')
         print(f"Loaded {len(df)} embeddings successfully")
@@ -123,12 +129,14 @@ def main():
                 print("Please ask a question or type 'bye' to exit.")
                 continue
             
+            started = time.perf_counter()
             print("Creating embedding for your question...")
             question_embedding = create_embedding([incoming_query])[0] 
+            embed_ms = (time.perf_counter() - started) * 1000
             
         
             print("Finding similar content...")
-            
+            search_started = time.perf_counter()
    
             embeddings_array = np.vstack(df['embedding'])
             question_embedding_array = np.array([question_embedding])
@@ -142,6 +150,7 @@ def main():
             top_results = 5
             max_indx = similarities.argsort()[::-1][0:top_results]
             new_df = df.loc[max_indx] 
+            search_ms = (time.perf_counter() - search_started) * 1000
             
             
             prompt = f'''I am teaching Mathematics in my Math Class course. Here are video subtitle chunks containing video title, video number, start time in seconds, end time in seconds, the text at that time:
@@ -152,23 +161,19 @@ def main():
 User asked this question related to the video chunks, you have to answer in a human way (dont mention the above format, its just for you) where and how much content is taught in which video (in which video and at what timestamp) and guide the user to go to that particular video. If user asks unrelated question, tell him that you can only answer questions related to the course
 '''
             
-            # Save prompt
-            try:
-                with open("prompt.txt", "w", encoding="utf-8") as f:
-                    f.write(prompt)
-                print("Prompt saved to prompt.txt")
-            except IOError as e:
-                print(f"Warning: Could not save prompt to file: {e}")
-            
             # Generate response
             print("Generating response...")
+            llm_started = time.perf_counter()
             try:
                 response_data = inference(prompt)
                 response = response_data["response"]
+                outcome = 'answered'
             except SystemExit:
                 # Fallback response when API times out
                 print("API timeout - providing fallback response based on similar content...")
                 response = create_fallback_response(new_df, incoming_query)
+                outcome = 'fallback'
+            llm_ms = (time.perf_counter() - llm_started) * 1000
             
             print("\n" + "="*50)
             print("🤖 AI Tutor:")
@@ -176,13 +181,27 @@ User asked this question related to the video chunks, you have to answer in a hu
             print(response)
             print("="*50)
             
-            # Save response
-            try:
-                with open("response.txt", "w", encoding="utf-8") as f:
-                    f.write(response)
-                print("\nResponse saved to response.txt")
-            except IOError as e:
-                print(f"Warning: Could not save response to file: {e}")
+            if journal:
+                journal.record({
+                    'query': incoming_query,
+                    'course_id': 'default',
+                    'chunks': [
+                        {'course_id': 'default', 'chunk_id': int(new_df.at[idx, 'chunk_id']), 'row': int(idx), 'score': round(float(similarities[idx]), 6)}
+                        for idx in max_indx
+                    ],
+                    'timings_ms': {
+                        'embed_ms': round(embed_ms, 1),
+                        'search_ms': round(search_ms, 1),
+                        'llm_ms': round(llm_ms, 1),
+                        'total_ms': round((time.perf_counter() - started) * 1000, 1)
+                    },
+                    'models': {
+                        'embedding': os.getenv('OPENAI_EMBEDDING_MODEL', 'text-embedding-3-small'),
+                        'chat': os.getenv('OPENAI_CHAT_MODEL', 'gpt-3.5-turbo')
+                    },
+                    'outcome': outcome,
+                    'embedding': encode_embedding(question_embedding)
+                })
             
             print("\n" + "-"*60 + "\n")
             
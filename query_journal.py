@@ -0,0 +1,163 @@
+import atexit
+import base64
+import glob
+import json
+import os
+import queue
+import threading
+import time
+import numpy as np
+
+# Append-only JSONL record of every query, written off the request path.
+# {pid} in the path gives each gunicorn worker its own file, so workers never share a rotation.
+DEFAULT_JOURNAL_PATH = os.path.join('logs', 'query_journal-{pid}.jsonl')
+
+
+def encode_embedding(embedding):
+    """Pack an embedding as base64 float32 so it can be replayed without another API call."""
+    return base64.b64encode(np.asarray(embedding, dtype='<f4').tobytes()).decode('ascii')
+
+
+def decode_embedding(encoded):
+    """Inverse of encode_embedding."""
+    return np.frombuffer(base64.b64decode(encoded), dtype='<f4')
+
+
+class QueryJournal:
+    """Writes query records to a size-rotated JSONL file from a background thread.
+
+    record() never blocks: when the bounded queue is full the record is dropped and counted.
+    Rotation is per process, so every worker restart starts a new file set; retention is therefore
+    applied across all files of the template ({pid} matched as a wildcard) by total size and age.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH, max_bytes=10 * 1024 * 1024, backup_count=5,
+                 queue_size=1000, flush_interval=1.0, max_total_bytes=100 * 1024 * 1024, max_age_days=30):
+        self.path_template = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.max_total_bytes = max_total_bytes
+        self.max_age_days = max_age_days
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._file = None
+        self._path = None
+
+    def record(self, entry):
+        """Queue a record for writing; drops it instead of waiting if the writer is behind."""
+        self._ensure_started()
+        entry.setdefault('ts', time.time())
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=5):
+        """Flush queued records and stop the writer thread."""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _ensure_started(self):
+        # Started lazily so the thread is created in the gunicorn worker, not the master
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='query-journal', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        self._path = self.path_template.format(pid=os.getpid())
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self._path, 'a', encoding='utf-8')
+        self._prune()
+        while True:
+            try:
+                entry = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._file.flush()
+                continue
+            if entry is None:
+                break
+            try:
+                self._write(json.dumps(entry, ensure_ascii=False) + "\n")
+            except Exception as e:
+                print(f"Warning: Could not write query journal record: {e}")
+        self._file.close()
+
+    def _write(self, line):
+        if self._file.tell() + len(line) > self.max_bytes:
+            self._rotate()
+        self._file.write(line)
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self._path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self._path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self._path, f"{self._path}.1")
+        else:
+            os.remove(self._path)
+        self._file = open(self._path, 'a', encoding='utf-8')
+        self._prune()
+
+    def _prune(self):
+        # Delete the oldest journal files of any process (including long-gone pids) until the set fits
+        files = []
+        for path in glob.glob(self.path_template.replace('{pid}', '*') + '*'):
+            if path == self._path:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+
+        total = sum(size for _, size, _ in files) + self._file.tell()
+        cutoff = time.time() - self.max_age_days * 86400 if self.max_age_days else None
+        for mtime, size, path in files:
+            too_old = cutoff is not None and mtime < cutoff
+            too_big = self.max_total_bytes and total > self.max_total_bytes
+            if not (too_old or too_big):
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Another worker pruned it first
+                pass
+            total -= size
+
+
+def read_journal(patterns):
+    """Yield records from journal files (globs allowed), oldest rotation first."""
+    paths = []
+    for pattern in patterns:
+        paths.extend(glob.glob(pattern))
+
+    def rotation_key(path):
+        # query_journal-1.jsonl.2 is older than query_journal-1.jsonl.1, which is older than the live file
+        base, _, suffix = path.rpartition('.')
+        return (base, -int(suffix)) if suffix.isdigit() else (path, 0)
+
+    for path in sorted(set(paths), key=rotation_key):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
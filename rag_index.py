@@ -0,0 +1,320 @@
+import argparse
+import heapq
+import json
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Pandas-free index format used by the serving path.
+# Embeddings are stored pre-normalized as float32 so a query only needs a dot product,
+# chunk metadata is stored as a single JSON string so loading never needs pickle.
+INDEX_FILE = 'embeddings.npz'
+LEGACY_INDEX_FILE = 'embeddings.joblib'
+METADATA_FIELDS = ['title', 'number', 'start', 'end', 'text']
+# Every embedding call (indexing and querying) must request this many dimensions
+EMBEDDING_DIMENSIONS = 1024
+
+# Per-course shards live in INDEX_DIR/<course_id>.npz; the default course is the original single index
+INDEX_DIR = 'indices'
+DEFAULT_COURSE_ID = 'default'
+DEFAULT_COURSE = {
+    'course_id': DEFAULT_COURSE_ID,
+    'name': 'Math Class',
+    'description': 'geometry and transformations'
+}
+COURSE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def normalize(matrix):
+    """Return L2-normalized float32 rows of a 2-D array."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    return matrix / (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-8)
+
+
+class EmbeddingIndex:
+    """In-memory embedding matrix plus chunk metadata."""
+
+    def __init__(self, embeddings, records, course=None):
+        self.embeddings = normalize(embeddings)
+        self.records = records
+        self.course = course or dict(DEFAULT_COURSE)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def dimensions(self):
+        return self.embeddings.shape[1]
+
+    def search_batch(self, query_embeddings, top_k=5):
+        """Return (indices, scores) arrays of shape (n_queries, top_k), best first."""
+        queries = normalize(query_embeddings)
+        if queries.shape[1] != self.dimensions:
+            raise ValueError(
+                f"Query embeddings have {queries.shape[1]} dimensions but the index has {self.dimensions}; "
+                f"embed queries with the same dimensions the index was built with"
+            )
+        similarities = queries @ self.embeddings.T
+        top_k = min(top_k, len(self.records))
+        if top_k == 0:
+            empty = np.empty((len(queries), 0))
+            return empty.astype(np.int64), empty
+        # argpartition avoids sorting the whole corpus for every query
+        candidates = np.argpartition(-similarities, top_k - 1, axis=1)[:, :top_k]
+        candidate_scores = np.take_along_axis(similarities, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1)
+        indices = np.take_along_axis(candidates, order, axis=1)
+        scores = np.take_along_axis(candidate_scores, order, axis=1)
+        return indices, scores
+
+    def search(self, query_embedding, top_k=5):
+        """Return a list of (index, score) tuples for a single query, best first."""
+        indices, scores = self.search_batch([query_embedding], top_k)
+        return [(int(i), float(s)) for i, s in zip(indices[0], scores[0])]
+
+    def get_records(self, indices):
+        """Return the metadata dicts (title, number, start, end, text) for the given rows."""
+        return [{field: self.records[i][field] for field in METADATA_FIELDS} for i in indices]
+
+
+def save_index(records, embeddings, path=INDEX_FILE, course=None):
+    """Save chunk records and their embeddings in the pandas-free index format."""
+    metadata = [{key: value for key, value in record.items() if key != 'embedding'} for record in records]
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    embeddings = normalize(embeddings)
+    np.savez(
+        path,
+        embeddings=embeddings,
+        dimensions=np.array(embeddings.shape[1]),
+        metadata=np.array(json.dumps(metadata, ensure_ascii=False)),
+        course=np.array(json.dumps(course or DEFAULT_COURSE, ensure_ascii=False))
+    )
+
+
+def _load_legacy_index(path):
+    """Load a pandas DataFrame pickled by older versions of preprocess.py."""
+    # joblib and pandas are only needed to unpickle the legacy file, so import them here
+    import joblib
+    df = joblib.load(path)
+    records = df.drop(columns=['embedding']).to_dict(orient='records')
+    embeddings = np.vstack(df['embedding'])
+    return EmbeddingIndex(embeddings, records)
+
+
+def load_index(path=INDEX_FILE, legacy_path=LEGACY_INDEX_FILE):
+    """Load the embedding index, falling back to the legacy joblib DataFrame."""
+    if os.path.exists(path):
+        with np.load(path, allow_pickle=False) as data:
+            embeddings = data['embeddings']
+            records = json.loads(str(data['metadata']))
+            course = json.loads(str(data['course'])) if 'course' in data.files else None
+            dimensions = int(data['dimensions']) if 'dimensions' in data.files else embeddings.shape[1]
+        if embeddings.ndim != 2 or embeddings.shape[1] != dimensions or len(embeddings) != len(records):
+            raise ValueError(
+                f"Corrupt index {path}: {embeddings.shape} embeddings for {len(records)} records, "
+                f"expected {dimensions} dimensions. Please run preprocess.py again."
+            )
+        if dimensions != EMBEDDING_DIMENSIONS:
+            raise ValueError(
+                f"{path} has {dimensions}-dimensional embeddings but queries use {EMBEDDING_DIMENSIONS}. "
+                f"Please run preprocess.py again."
+            )
+        return EmbeddingIndex(embeddings, records, course)
+
+    if legacy_path and os.path.exists(legacy_path):
+        print(f"⚠️  {path} not found, converting legacy {legacy_path} (requires pandas). Run 'python rag_index.py --convert' to avoid this.")
+        return _load_legacy_index(legacy_path)
+
+    raise FileNotFoundError(f"{path} file not found. Please run preprocess.py first.")
+
+
+def shard_path(course_id, index_dir=INDEX_DIR):
+    """Return the index file for a course id, rejecting ids that are not safe file names."""
+    if not COURSE_ID_PATTERN.match(course_id or ''):
+        raise ValueError(f"Invalid course id: {course_id!r}")
+    if course_id == DEFAULT_COURSE_ID:
+        return INDEX_FILE
+    return os.path.join(index_dir, f"{course_id}.npz")
+
+
+class ShardManager:
+    """Lazily loads per-course index shards and keeps the most recently used ones resident."""
+
+    def __init__(self, index_dir=INDEX_DIR, max_resident=4, max_workers=4):
+        self.index_dir = index_dir
+        self.max_resident = max(1, max_resident)
+        self.max_workers = max(1, max_workers)
+        self._shards = OrderedDict()
+        self._lock = threading.Lock()
+
+    def available_courses(self):
+        """Return the ids of all courses that have an index on disk."""
+        courses = []
+        if os.path.exists(INDEX_FILE) or os.path.exists(LEGACY_INDEX_FILE):
+            courses.append(DEFAULT_COURSE_ID)
+        if os.path.isdir(self.index_dir):
+            for name in sorted(os.listdir(self.index_dir)):
+                course_id = name[:-len('.npz')]
+                if name.endswith('.npz') and COURSE_ID_PATTERN.match(course_id) and course_id != DEFAULT_COURSE_ID:
+                    courses.append(course_id)
+        return courses
+
+    def resident_courses(self):
+        """Return the ids of the shards currently held in memory, least recently used first."""
+        with self._lock:
+            return list(self._shards)
+
+    def get(self, course_id):
+        """Return the shard for a course, loading it and evicting the least recently used one if needed."""
+        path = shard_path(course_id, self.index_dir)
+        with self._lock:
+            if course_id in self._shards:
+                self._shards.move_to_end(course_id)
+                return self._shards[course_id]
+
+        # Load outside the lock so a slow load does not block queries on resident shards
+        shard = self._load(course_id, path)
+        print(f"✅ Loaded shard '{course_id}' with {len(shard)} embeddings")
+
+        with self._lock:
+            self._shards[course_id] = shard
+            self._shards.move_to_end(course_id)
+            while len(self._shards) > self.max_resident:
+                evicted, _ = self._shards.popitem(last=False)
+                print(f"Evicted shard '{evicted}'")
+        return shard
+
+    def search(self, course_id, query_embedding, top_k=5):
+        """Search a single course and return its top-k records with scores."""
+        shard = self.get(course_id)
+        results = shard.search(query_embedding, top_k)
+        return self._to_results(course_id, shard, results)
+
+    def search_many(self, query_embedding, course_ids=None, top_k=5):
+        """Fan a query out across several course shards in parallel and merge the global top-k.
+
+        Shards that are not resident are loaded, searched and dropped without entering the LRU,
+        so a fan-out over more courses than max_resident does not evict the active courses.
+        """
+        course_ids = course_ids or self.available_courses()
+        if not course_ids:
+            raise FileNotFoundError("No course indices found. Please run preprocess.py first.")
+
+        def search_shard(course_id):
+            shard = self._peek_or_load(course_id)
+            return self._to_results(course_id, shard, shard.search(query_embedding, top_k))
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(course_ids))) as executor:
+            per_shard = list(executor.map(search_shard, course_ids))
+
+        merged = heapq.merge(*per_shard, key=lambda result: -result['score'])
+        return list(merged)[:top_k]
+
+    def expand(self, refs, window=1, max_results=8):
+        """Rebuild results from (course_id, row, score) refs and add neighbouring chunks of the same video.
+
+        Used for follow-up questions: the previous result set is reused and widened with the
+        surrounding transcript instead of embedding and searching again. Like search_many, this
+        does not pull the courses of a fan-out answer into the LRU, and refs to rows that no
+        longer exist (the shard was rebuilt since) are dropped.
+        """
+        shards = {}
+        for course_id in dict.fromkeys(course_id for course_id, _, _ in refs):
+            shards[course_id] = self._peek_or_load(course_id)
+        refs = [(course_id, row, score) for course_id, row, score in refs if 0 <= row < len(shards[course_id])]
+
+        selected = OrderedDict()
+        for course_id, row, score in refs:
+            selected.setdefault((course_id, row), score)
+        for course_id, row, score in refs:
+            shard = shards[course_id]
+            title = shard.records[row]['title']
+            for offset in range(1, window + 1):
+                for neighbour in (row - offset, row + offset):
+                    if len(selected) >= max_results:
+                        break
+                    if 0 <= neighbour < len(shard) and shard.records[neighbour]['title'] == title:
+                        selected.setdefault((course_id, neighbour), score)
+
+        results = []
+        for (course_id, row), score in selected.items():
+            results.extend(self._to_results(course_id, shards[course_id], [(row, score)]))
+        # Keep transcript order within a video so the widened context reads naturally
+        results.sort(key=lambda result: (result['course_id'], result['title'], result['row']))
+        return results
+
+    def _peek_or_load(self, course_id):
+        # Resident shards are used in place; others are loaded for this call only and never enter the LRU
+        path = shard_path(course_id, self.index_dir)
+        with self._lock:
+            shard = self._shards.get(course_id)
+        return shard if shard is not None else self._load(course_id, path)
+
+    @staticmethod
+    def _load(course_id, path):
+        if course_id == DEFAULT_COURSE_ID:
+            return load_index(path)
+        return load_index(path, legacy_path=None)
+
+    @staticmethod
+    def _to_results(course_id, shard, results):
+        records = shard.get_records([idx for idx, _ in results])
+        return [
+            dict(record, course_id=course_id, row=idx, chunk_id=shard.records[idx].get('chunk_id', idx), score=score)
+            for record, (idx, score) in zip(records, results)
+        ]
+
+
+def convert_legacy_index(legacy_path=LEGACY_INDEX_FILE, path=INDEX_FILE):
+    """Rewrite a legacy embeddings.joblib as embeddings.npz without calling the embeddings API again."""
+    index = _load_legacy_index(legacy_path)
+    if index.dimensions != EMBEDDING_DIMENSIONS:
+        raise ValueError(
+            f"{legacy_path} has {index.dimensions}-dimensional embeddings but queries use {EMBEDDING_DIMENSIONS}; "
+            f"it has to be rebuilt with preprocess.py"
+        )
+    save_index(index.records, index.embeddings, path, index.course)
+    return index
+
+
+def parse_args():
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Maintain the serving index.")
+    parser.add_argument('--convert', action='store_true',
+                        help="Convert a legacy embeddings.joblib to embeddings.npz (needs requirements-offline.txt)")
+    parser.add_argument('--legacy-path', default=LEGACY_INDEX_FILE, help="Legacy joblib DataFrame to read")
+    parser.add_argument('--output', default=INDEX_FILE, help="Index file to write")
+    return parser.parse_args()
+
+
+def main():
+    """Main function for the one-off legacy index conversion."""
+    args = parse_args()
+    try:
+        if not args.convert:
+            print("Nothing to do. Use --convert to turn embeddings.joblib into embeddings.npz.")
+            sys.exit(1)
+        if not os.path.exists(args.legacy_path):
+            print(f"Error: '{args.legacy_path}' not found.")
+            sys.exit(1)
+
+        index = convert_legacy_index(args.legacy_path, args.output)
+        print(f"Successfully converted {len(index)} embeddings from {args.legacy_path} to {args.output}")
+
+    except KeyboardInterrupt:
+        print("\nOperation cancelled by user.")
+        sys.exit(0)
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import argparse
+import json
+import os
+import sys
+import time
+from dotenv import load_dotenv
+from rag_index import ShardManager, EMBEDDING_DIMENSIONS
+from query_journal import read_journal, decode_embedding
+
+# Load environment variables
+load_dotenv()
+
+STAGES = ['embed_ms', 'search_ms', 'llm_ms', 'total_ms']
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+
+def create_embedding(text_list):
+    """Embed queries that were journaled without their embedding (needs OPENAI_API_KEY)."""
+    from openai import OpenAI
+    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    response = client.embeddings.create(
+        model=os.getenv('OPENAI_EMBEDDING_MODEL', 'text-embedding-3-small'),
+        input=text_list,
+        dimensions=EMBEDDING_DIMENSIONS
+    )
+    return [data.embedding for data in response.data]
+
+
+def replay(records, shards, top_k, embed_missing):
+    """Re-run retrieval for journaled queries and compare with what was served."""
+    replayed = []
+    skipped = {'follow_up': 0, 'error': 0, 'no_embedding': 0}
+
+    pending = [r for r in records if r.get('outcome') != 'error' and not r.get('follow_up')]
+    skipped['follow_up'] = sum(1 for r in records if r.get('follow_up'))
+    skipped['error'] = sum(1 for r in records if r.get('outcome') == 'error')
+
+    missing = [r for r in pending if 'embedding' not in r]
+    if missing and embed_missing:
+        print(f"Embedding {len(missing)} queries that were journaled without embeddings...")
+        for start in range(0, len(missing), 100):
+            batch = missing[start:start + 100]
+            for record, embedding in zip(batch, create_embedding([r['query'] for r in batch])):
+                record['embedding_vector'] = embedding
+
+    for record in pending:
+        if 'embedding' in record:
+            embedding = decode_embedding(record['embedding'])
+        elif 'embedding_vector' in record:
+            embedding = record['embedding_vector']
+        else:
+            skipped['no_embedding'] += 1
+            continue
+
+        started = time.perf_counter()
+        if record.get('fan_out'):
+            results = shards.search_many(embedding, top_k=top_k)
+        else:
+            results = shards.search(record.get('course_id', 'default'), embedding, top_k)
+        search_ms = (time.perf_counter() - started) * 1000
+
+        served = {(c['course_id'], c['chunk_id']) for c in record.get('chunks', [])[:top_k]}
+        now = {(r['course_id'], r['chunk_id']) for r in results}
+        replayed.append({
+            'query': record['query'],
+            'search_ms': search_ms,
+            'overlap': len(served & now) / max(1, len(served)),
+            'same_order': [(c['course_id'], c['chunk_id']) for c in record.get('chunks', [])[:top_k]]
+                          == [(r['course_id'], r['chunk_id']) for r in results]
+        })
+    return replayed, skipped
+
+
+def parse_args():
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Replay the query journal through the retrieval engine.")
+    parser.add_argument('journals', nargs='+', help="Journal files or globs, e.g. 'logs/query_journal-*.jsonl*'")
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--limit', type=int, default=None, help="Only replay the first N records")
+    parser.add_argument('--embed', action='store_true', help="Embed queries journaled without an embedding")
+    parser.add_argument('--slowest', type=int, default=10, help="How many of the slowest journaled queries to list")
+    parser.add_argument('--json', dest='json_output', default=None, help="Also write the report to this JSON file")
+    return parser.parse_args()
+
+
+def main():
+    """Main function to replay journaled queries and report regressions and latency."""
+    args = parse_args()
+    try:
+        records = list(read_journal(args.journals))
+        if args.limit:
+            records = records[:args.limit]
+        if not records:
+            print("Error: No journal records found.")
+            sys.exit(1)
+        print(f"Loaded {len(records)} journal records")
+
+        shards = ShardManager(max_resident=int(os.getenv('MAX_RESIDENT_SHARDS', 4)))
+        replayed, skipped = replay(records, shards, args.top_k, args.embed)
+
+        outcomes = {}
+        for record in records:
+            outcomes[record.get('outcome')] = outcomes.get(record.get('outcome'), 0) + 1
+        stages = {}
+        for stage in STAGES:
+            values = [r['timings_ms'][stage] for r in records if stage in r.get('timings_ms', {})]
+            stages[stage] = {'p50': percentile(values, 50), 'p95': percentile(values, 95), 'p99': percentile(values, 99)}
+        search_times = [r['search_ms'] for r in replayed]
+        slowest = sorted(records, key=lambda r: r.get('timings_ms', {}).get('total_ms', 0), reverse=True)[:args.slowest]
+
+        report = {
+            'records': len(records),
+            'replayed': len(replayed),
+            'skipped': skipped,
+            'outcomes': outcomes,
+            'mean_overlap': round(sum(r['overlap'] for r in replayed) / len(replayed), 4) if replayed else None,
+            'same_order_rate': round(sum(r['same_order'] for r in replayed) / len(replayed), 4) if replayed else None,
+            'replay_search_ms': {
+                'p50': percentile(search_times, 50),
+                'p95': percentile(search_times, 95),
+                'p99': percentile(search_times, 99)
+            },
+            'journal_stage_ms': stages,
+            'slowest': [{'query': r['query'], 'timings_ms': r.get('timings_ms', {})} for r in slowest]
+        }
+
+        print("\n" + "="*60)
+        print(" Query journal replay")
+        print("="*60)
+        print(f"Replayed:        {report['replayed']} of {report['records']} (skipped {skipped})")
+        print(f"Outcomes:        {outcomes}")
+        print(f"Top-{args.top_k} overlap:   {report['mean_overlap']}  (same order: {report['same_order_rate']})")
+        replay_ms = report['replay_search_ms']
+        if search_times:
+            print(f"Replay search:   p50 {replay_ms['p50']:.2f} ms, p95 {replay_ms['p95']:.2f} ms, p99 {replay_ms['p99']:.2f} ms")
+        print("\nJournaled stage timings (ms):")
+        for stage, values in stages.items():
+            print(f"  {stage:<10} p50 {values['p50']}  p95 {values['p95']}  p99 {values['p99']}")
+        print(f"\nSlowest {len(slowest)} queries:")
+        for r in slowest:
+            print(f"  {r.get('timings_ms', {}).get('total_ms')} ms  {r['query'][:70]}")
+        print("="*60)
+
+        if args.json_output:
+            with open(args.json_output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            print(f"Report saved to {args.json_output}")
+
+    except KeyboardInterrupt:
+        print("\nOperation cancelled by user.")
+        sys.exit(0)
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import json
+import os
+import subprocess
+import sys
+
+# Code run in a fresh interpreter to mimic a gunicorn worker booting app_minimal
+WORKER_BOOT = """
+import json, resource, sys, time
+start = time.perf_counter()
+import app_minimal
+elapsed = time.perf_counter() - start
+heavy = [name for name in ('pandas', 'sklearn', 'scipy', 'joblib', 'openai') if name in sys.modules]
+print("STARTUP_STATS " + json.dumps({
+    'boot_seconds': elapsed,
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'embeddings_loaded': bool(app_minimal.shards.resident_courses()),
+    'heavy_modules_loaded': heavy,
+}))
+"""
+
+
+def parse_importtime(stderr):
+    """Parse `python -X importtime` output into (self_us, cumulative_us, module) tuples."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        try:
+            self_us, cumulative_us, module = line[len('import time:'):].split('|', 2)
+            rows.append((int(self_us), int(cumulative_us), module.rstrip()))
+        except ValueError:
+            continue
+    return rows
+
+
+def main():
+    """Boot app_minimal in a child interpreter and report import time and memory."""
+    try:
+        top_n = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+
+        print("Booting app_minimal with -X importtime...")
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', WORKER_BOOT],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True
+        )
+
+        stats = None
+        for line in result.stdout.splitlines():
+            if line.startswith('STARTUP_STATS '):
+                stats = json.loads(line[len('STARTUP_STATS '):])
+
+        if result.returncode != 0 or stats is None:
+            print("Error: app_minimal failed to import:")
+            print(result.stderr[-2000:])
+            sys.exit(1)
+
+        rows = parse_importtime(result.stderr)
+        # importtime indents nested imports by two spaces per level; keep the app and its direct imports
+        top_level = [row for row in rows if len(row[2]) - len(row[2].lstrip()) <= 3]
+        top_level.sort(key=lambda row: row[1], reverse=True)
+
+        print("\n" + "="*60)
+        print(" Worker startup report")
+        print("="*60)
+        print(f"Boot time:          {stats['boot_seconds']*1000:.0f} ms")
+        print(f"Peak RSS:           {stats['max_rss_mb']:.1f} MB")
+        print(f"Embeddings loaded:  {stats['embeddings_loaded']}")
+        heavy = ', '.join(stats['heavy_modules_loaded']) or 'none'
+        print(f"Heavy modules:      {heavy}")
+        print("\nSlowest imports (cumulative):")
+        for self_us, cumulative_us, module in top_level[:top_n]:
+            print(f"  {cumulative_us/1000:8.1f} ms  {module.strip()}")
+        print("="*60)
+
+    except KeyboardInterrupt:
+        print("\nOperation cancelled by user.")
+        sys.exit(0)
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,30 @@
 // Chat functionality
 let isLoading = false;
 
+// Course to ask about, e.g. /?course=algebra1 (the server falls back to the default course)
+const courseId = new URLSearchParams(window.location.search).get('course');
+
+// Server-side chat session, kept for the lifetime of the tab so follow-up questions have context
+let sessionId = sessionStorage.getItem('chatSessionId');
+
+// Typeahead suggestions: requests are debounced, cached per prefix and stale ones are aborted
+const SUGGEST_DEBOUNCE_MS = 150;
+const suggestionCache = new Map();
+let suggestTimer = null;
+let suggestController = null;
+let activeSuggestion = -1;
+
+// When the server sheds a chat request (HTTP 429) retry after Retry-After, backing off each time
+const MAX_CHAT_RETRIES = 3;
+const MAX_BACKOFF_MS = 30000;
+
 // DOM elements
 const chatMessages = document.getElementById('chatMessages');
 const messageInput = document.getElementById('messageInput');
 const sendButton = document.getElementById('sendButton');
 const typingIndicator = document.getElementById('typingIndicator');
 const loadingOverlay = document.getElementById('loadingOverlay');
+const suggestionsBox = document.getElementById('suggestions');
 
 // Initialize chat
 document.addEventListener('DOMContentLoaded', function() {
@@ -18,6 +36,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // Focus on input
     messageInput.focus();
     
+    // Get a session before the first question so it is not rate limited by the shared school address
+    ensureSession();
+    
     // Add event listeners
     messageInput.addEventListener('keypress', function(e) {
         if (e.key === 'Enter' && !e.shiftKey) {
@@ -28,7 +49,11 @@ document.addEventListener('DOMContentLoaded', function() {
     
     messageInput.addEventListener('input', function() {
         sendButton.disabled = !this.value.trim() || isLoading;
+        scheduleSuggestions(this.value);
     });
+    
+    messageInput.addEventListener('keydown', handleSuggestionKeys);
+    messageInput.addEventListener('blur', hideSuggestions);
 });
 
 // Send message function
@@ -36,6 +61,8 @@ async function sendMessage() {
     const message = messageInput.value.trim();
     if (!message || isLoading) return;
     
+    hideSuggestions();
+    
     // Add user message to chat
     addMessage(message, 'user');
     
@@ -49,13 +76,20 @@ async function sendMessage() {
     
     try {
         // Send message to backend
-        const response = await fetch('/api/chat', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ message: message })
-        });
+        await ensureSession();
+        const response = await postChat({ message: message, course_id: courseId, session_id: sessionId });
+        
+        if (response.status === 429) {
+            const retryAfter = parseInt(response.headers.get('Retry-After'), 10) || 5;
+            const rejection = await response.json().catch(() => ({}));
+            hideTypingIndicator();
+            if (rejection.reason === 'rate_limited') {
+                addMessage(`You are asking questions very quickly. Please wait about ${retryAfter} seconds before the next one.`, 'ai');
+            } else {
+                addMessage(`Lots of students are asking questions right now. Please try again in about ${retryAfter} seconds.`, 'ai');
+            }
+            return;
+        }
         
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
@@ -63,6 +97,11 @@ async function sendMessage() {
         
         const data = await response.json();
         
+        if (data.session_id) {
+            sessionId = data.session_id;
+            sessionStorage.setItem('chatSessionId', sessionId);
+        }
+        
         // Hide typing indicator
         hideTypingIndicator();
         
@@ -80,6 +119,151 @@ async function sendMessage() {
     }
 }
 
+// Ask the server for a chat session id if this tab does not have one yet
+async function ensureSession() {
+    if (sessionId) return;
+    try {
+        const response = await fetch('/api/session', { method: 'POST' });
+        if (!response.ok) return;
+        const data = await response.json();
+        sessionId = data.session_id;
+        sessionStorage.setItem('chatSessionId', sessionId);
+    } catch (error) {
+        // Chatting still works without a session, it is just keyed by address until the first answer
+        console.error('Could not start a chat session:', error);
+    }
+}
+
+// POST to /api/chat, retrying with exponential backoff and jitter while the server is too busy (429).
+// A 429 for this student's own rate limit is not retried: retrying would only use up more of it
+async function postChat(body) {
+    let response;
+    for (let attempt = 0; attempt <= MAX_CHAT_RETRIES; attempt++) {
+        response = await fetch('/api/chat', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(body)
+        });
+        if (response.status !== 429 || attempt === MAX_CHAT_RETRIES) {
+            return response;
+        }
+        const rejection = await response.clone().json().catch(() => ({}));
+        if (rejection.reason === 'rate_limited') {
+            return response;
+        }
+        
+        const retryAfter = parseInt(response.headers.get('Retry-After'), 10) || 1;
+        const backoff = Math.min(retryAfter * 1000 * 2 ** attempt, MAX_BACKOFF_MS);
+        // Jitter spreads a classroom's retries out instead of sending them all at the same moment
+        await new Promise(resolve => setTimeout(resolve, backoff * (0.5 + Math.random() * 0.5)));
+    }
+    return response;
+}
+
+// Fetch suggestions once the user pauses typing
+function scheduleSuggestions(text) {
+    clearTimeout(suggestTimer);
+    const prefix = text.trim().toLowerCase();
+    if (prefix.length < 2) {
+        hideSuggestions();
+        return;
+    }
+    if (suggestionCache.has(prefix)) {
+        renderSuggestions(suggestionCache.get(prefix));
+        return;
+    }
+    suggestTimer = setTimeout(() => fetchSuggestions(prefix), SUGGEST_DEBOUNCE_MS);
+}
+
+async function fetchSuggestions(prefix) {
+    if (suggestController) {
+        suggestController.abort();
+    }
+    suggestController = new AbortController();
+    
+    const params = new URLSearchParams({ q: prefix });
+    if (courseId) {
+        params.set('course_id', courseId);
+    }
+    
+    try {
+        const response = await fetch(`/api/suggest?${params}`, { signal: suggestController.signal });
+        if (!response.ok) {
+            return;
+        }
+        const data = await response.json();
+        suggestionCache.set(prefix, data.suggestions);
+        // Only show them if the input still matches what was asked for
+        if (messageInput.value.trim().toLowerCase() === prefix) {
+            renderSuggestions(data.suggestions);
+        }
+    } catch (error) {
+        if (error.name !== 'AbortError') {
+            console.error('Suggestion error:', error);
+        }
+    }
+}
+
+function renderSuggestions(suggestions) {
+    suggestionsBox.innerHTML = '';
+    activeSuggestion = -1;
+    if (!suggestions.length || isLoading) {
+        hideSuggestions();
+        return;
+    }
+    
+    const icons = { video: 'fa-video', question: 'fa-question-circle', topic: 'fa-lightbulb' };
+    suggestions.forEach(suggestion => {
+        const item = document.createElement('div');
+        item.className = 'suggestion';
+        const icon = document.createElement('i');
+        icon.className = `fas ${icons[suggestion.kind] || 'fa-search'}`;
+        const text = document.createElement('span');
+        text.textContent = suggestion.text;
+        item.appendChild(icon);
+        item.appendChild(text);
+        // mousedown fires before the input's blur hides the list
+        item.addEventListener('mousedown', function(e) {
+            e.preventDefault();
+            chooseSuggestion(suggestion.text);
+        });
+        suggestionsBox.appendChild(item);
+    });
+    suggestionsBox.style.display = 'block';
+}
+
+function chooseSuggestion(text) {
+    hideSuggestions();
+    askQuestion(text);
+}
+
+function handleSuggestionKeys(e) {
+    const items = suggestionsBox.querySelectorAll('.suggestion');
+    if (suggestionsBox.style.display === 'none' || !items.length) {
+        return;
+    }
+    if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+        e.preventDefault();
+        const step = e.key === 'ArrowDown' ? 1 : -1;
+        activeSuggestion = (activeSuggestion + step + items.length) % items.length;
+        items.forEach((item, i) => item.classList.toggle('active', i === activeSuggestion));
+    } else if (e.key === 'Enter' && activeSuggestion >= 0) {
+        e.preventDefault();
+        e.stopImmediatePropagation();
+        chooseSuggestion(items[activeSuggestion].textContent);
+    } else if (e.key === 'Escape') {
+        hideSuggestions();
+    }
+}
+
+function hideSuggestions() {
+    clearTimeout(suggestTimer);
+    suggestionsBox.style.display = 'none';
+    activeSuggestion = -1;
+}
+
 // Add message to chat
 function addMessage(content, sender) {
     const messageDiv = document.createElement('div');
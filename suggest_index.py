@@ -0,0 +1,259 @@
+import argparse
+import json
+import os
+import re
+import sys
+from collections import Counter
+from rag_index import DEFAULT_COURSE_ID, INDEX_DIR, COURSE_ID_PATTERN
+from transcript_store import iter_transcript_files, transcript_source, STORE_DIR
+
+# Typeahead suggestions for /api/suggest.
+# Built offline (python suggest_index.py) from video titles, key phrases mined from the
+# transcripts and popular past questions in the query journal; loaded into a prefix trie at runtime.
+SUGGESTIONS_FILE = 'suggestions.json'
+MAX_PREFIX_DEPTH = 32
+WORD_PATTERN = re.compile(r"[a-z0-9][a-z0-9'=\-]*")
+STOPWORDS = set("""
+a about above after again all also am an and any are as at be because been before being below between both but by
+can could did do does doing down during each few for from further had has have having he her here hers him his how i
+if in into is it its itself just let like me more most my no nor not now of off on once only or other our out over own
+right same she should so some such than that the their them then there these they this those through to too under
+until up very was we were what when where which while who whom why will with would you your yeah okay going gonna
+get got go let's that's it's we're i'm you're there's what's so this one two well really kind thing
+""".split())
+
+# Weights: a title or a frequently asked question should outrank a phrase that merely occurs often
+TITLE_WEIGHT = 50
+QUESTION_WEIGHT = 10
+
+
+def normalize_text(text):
+    """Lowercase and collapse whitespace so prefixes match regardless of typing style."""
+    return ' '.join(text.lower().split())
+
+
+def suggestions_path(course_id, index_dir=INDEX_DIR):
+    """Return the suggestions file for a course."""
+    if not COURSE_ID_PATTERN.match(course_id or ''):
+        raise ValueError(f"Invalid course id: {course_id!r}")
+    if course_id == DEFAULT_COURSE_ID:
+        return SUGGESTIONS_FILE
+    return os.path.join(index_dir, f"{course_id}.suggestions.json")
+
+
+class PrefixIndex:
+    """Character trie where every node keeps its best suggestions, so a lookup is one walk down the prefix."""
+
+    def __init__(self, max_per_node=8):
+        self.max_per_node = max_per_node
+        self.suggestions = []
+        self.root = {}
+
+    def __len__(self):
+        return len(self.suggestions)
+
+    def add(self, text, weight, kind):
+        """Index a suggestion under the prefixes of every word it contains."""
+        suggestion_id = len(self.suggestions)
+        self.suggestions.append({'text': text, 'kind': kind})
+        normalized = normalize_text(text)
+        starts = [0] + [i + 1 for i, char in enumerate(normalized) if char == ' ']
+        for position, start in enumerate(starts):
+            # Matches at the start of the suggestion rank above matches on a later word
+            score = weight if position == 0 else weight / 2
+            node = self.root
+            for char in normalized[start:start + MAX_PREFIX_DEPTH]:
+                node = node.setdefault(char, {})
+                self._offer(node, score, suggestion_id)
+
+    def _offer(self, node, score, suggestion_id):
+        top = node.setdefault('', [])
+        for i, (existing_score, existing_id) in enumerate(top):
+            if existing_id == suggestion_id:
+                if score <= existing_score:
+                    return
+                del top[i]
+                break
+        top.append((score, suggestion_id))
+        top.sort(key=lambda item: -item[0])
+        del top[self.max_per_node:]
+
+    def suggest(self, prefix, limit=5):
+        """Return up to `limit` suggestions for a typed prefix."""
+        normalized = normalize_text(prefix)
+        if not normalized:
+            return []
+        node = self.root
+        for char in normalized[:MAX_PREFIX_DEPTH]:
+            node = node.get(char)
+            if node is None:
+                return []
+        results = []
+        for _, suggestion_id in node.get('', []):
+            suggestion = self.suggestions[suggestion_id]
+            # Prefixes longer than the trie depth are checked against the full text
+            if len(normalized) > MAX_PREFIX_DEPTH and normalized not in normalize_text(suggestion['text']):
+                continue
+            results.append(suggestion)
+            if len(results) >= limit:
+                break
+        return results
+
+    @classmethod
+    def from_entries(cls, entries, max_per_node=8):
+        """Build an index from [{'text', 'weight', 'kind'}] entries."""
+        index = cls(max_per_node)
+        for entry in entries:
+            index.add(entry['text'], entry['weight'], entry['kind'])
+        return index
+
+
+def load_suggestions(path=SUGGESTIONS_FILE):
+    """Load a suggestions file built by this module into a PrefixIndex."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return PrefixIndex.from_entries(json.load(f)['suggestions'])
+
+
+def clean_title(title):
+    """Turn 'Applying similar triangles ｜ Similarity ... [MlGOhzYn-QQ]' into 'Applying similar triangles'."""
+    title = re.sub(r'\s*\[[^\]]+\]\s*$', '', title)
+    return re.split(r'\s*[｜|]\s*', title)[0].strip()
+
+
+def mine_phrases(texts, max_phrases=300, min_count=3):
+    """Return the most frequent 2-3 word phrases that do not start or end with a stopword."""
+    counts = Counter()
+    for text in texts:
+        words = WORD_PATTERN.findall(text.lower())
+        for n in (2, 3):
+            for i in range(len(words) - n + 1):
+                gram = words[i:i + n]
+                if gram[0] in STOPWORDS or gram[-1] in STOPWORDS or any(w.isdigit() for w in gram):
+                    continue
+                counts[' '.join(gram)] += 1
+    return [(phrase, count) for phrase, count in counts.most_common(max_phrases) if count >= min_count]
+
+
+def popular_questions(journal_patterns, course_id, min_sessions=5, max_questions=300):
+    """Return (question, sessions) pairs asked in at least `min_sessions` distinct chat sessions.
+
+    Counting sessions rather than records means one student repeating a question cannot promote it.
+    Records without a session id (command line tools) are ignored.
+    """
+    from query_journal import read_journal
+    askers = {}
+    originals = {}
+    for record in read_journal(journal_patterns):
+        if record.get('course_id', DEFAULT_COURSE_ID) != course_id or record.get('follow_up'):
+            continue
+        query = record.get('query', '').strip()
+        session_id = record.get('session_id')
+        if not query or not session_id:
+            continue
+        key = normalize_text(query).rstrip('?')
+        askers.setdefault(key, set()).add(session_id)
+        originals.setdefault(key, query)
+    counts = Counter({key: len(sessions) for key, sessions in askers.items()})
+    return [(originals[key], count) for key, count in counts.most_common(max_questions) if count >= min_sessions]
+
+
+def is_on_topic(question, vocabulary):
+    """Return True if every non-stopword of a student question occurs somewhere in the course transcripts.
+
+    Questions are written by students and shown to other students, so anything mentioning words the
+    course never uses (names, insults, off-topic chatter) is left out.
+    """
+    words = [w for w in WORD_PATTERN.findall(question.lower()) if w not in STOPWORDS]
+    return bool(words) and all(w in vocabulary for w in words)
+
+
+def read_question_list(path):
+    """Read a file of questions, one per line, normalized for comparison."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return {normalize_text(line).rstrip('?') for line in f if line.strip()}
+
+
+def build_entries(source_dir, journal_patterns, course_id, min_sessions=5, allowlist=None):
+    """Collect weighted suggestion entries from transcripts and the query journal.
+
+    Journal questions must be asked in `min_sessions` sessions and pass is_on_topic(); with an
+    allowlist only questions on it are used.
+    """
+    titles = set()
+    texts = []
+    for transcript_file, segments in iter_transcript_files(source_dir):
+        try:
+            for chunk in segments:
+                titles.add(clean_title(chunk.get('title', '')))
+                texts.append(chunk.get('text', ''))
+        except (ValueError, IOError) as e:
+            print(f"Warning: Could not read {transcript_file}: {e}")
+            continue
+
+    entries = [{'text': title, 'weight': TITLE_WEIGHT, 'kind': 'video'} for title in sorted(titles) if title]
+    entries += [{'text': phrase, 'weight': count, 'kind': 'topic'} for phrase, count in mine_phrases(texts)]
+    if journal_patterns:
+        vocabulary = set()
+        for text in texts:
+            vocabulary.update(WORD_PATTERN.findall(text.lower()))
+        for title in titles:
+            vocabulary.update(WORD_PATTERN.findall(title.lower()))
+        for question, count in popular_questions(journal_patterns, course_id, min_sessions):
+            if allowlist is not None:
+                if normalize_text(question).rstrip('?') not in allowlist:
+                    continue
+            elif not is_on_topic(question, vocabulary):
+                print(f"Skipping off-topic question: {question[:60]}")
+                continue
+            entries.append({'text': question, 'weight': QUESTION_WEIGHT * count, 'kind': 'question'})
+    return entries
+
+
+def parse_args():
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Build the typeahead suggestion index for /api/suggest.")
+    parser.add_argument('--course', default=DEFAULT_COURSE_ID, help="Course id the suggestions are for")
+    parser.add_argument('--transcripts-dir', default=None,
+                        help=f"Directory containing the compact transcript store (default: {STORE_DIR}/ when it has .seg files)")
+    parser.add_argument('--jsons-dir', default=None,
+                        help="Directory containing the JSON transcripts (default: jsons/ when there is no transcript store)")
+    parser.add_argument('--journal', nargs='*', default=[os.path.join('logs', 'query_journal-*.jsonl*')],
+                        help="Query journal files/globs to mine popular questions from")
+    parser.add_argument('--min-sessions', type=int, default=5,
+                        help="Distinct chat sessions that must ask a question before it is suggested")
+    parser.add_argument('--allowlist', default=None,
+                        help="File of reviewed questions, one per line; only these journal questions are suggested")
+    return parser.parse_args()
+
+
+def main():
+    """Main function to build the suggestions file."""
+    args = parse_args()
+    try:
+        source_dir = transcript_source(args.transcripts_dir, args.jsons_dir)
+        if not os.path.exists(source_dir):
+            print(f"Error: '{source_dir}' directory not found. Please run mp4_to_json.py first.")
+            sys.exit(1)
+
+        output = suggestions_path(args.course)
+        allowlist = read_question_list(args.allowlist) if args.allowlist else None
+        entries = build_entries(source_dir, args.journal, args.course, args.min_sessions, allowlist)
+        kinds = Counter(entry['kind'] for entry in entries)
+        print(f"Collected {len(entries)} suggestions: {dict(kinds)}")
+
+        directory = os.path.dirname(output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({'course_id': args.course, 'suggestions': entries}, f, ensure_ascii=False)
+        print(f"Successfully saved suggestions to {output}")
+
+    except KeyboardInterrupt:
+        print("\nOperation cancelled by user.")
+        sys.exit(0)
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import argparse
+import json
+import os
+import struct
+import sys
+
+# Compact transcript store: one .seg file per video.
+#
+#   b'RAGT' | u8 version | u32 header length | header JSON (file, title, count)
+#   then per segment: u32 number | f64 start | f64 end | u32 text length | UTF-8 text
+#
+# The title is stored once per video instead of on every segment, the full text is not stored
+# (it is the concatenation of the segments) and segments can be read one at a time.
+STORE_DIR = 'transcripts'
+STORE_EXTENSION = '.seg'
+MAGIC = b'RAGT'
+VERSION = 1
+SEGMENT_HEADER = struct.Struct('<IddI')
+LENGTH = struct.Struct('<I')
+
+
+def write_transcript(path, file_name, title, segments):
+    """Write one video's segments ({number, start, end, text} dicts) to a .seg file."""
+    segments = list(segments)
+    header = json.dumps({'file': file_name, 'title': title, 'count': len(segments)}, ensure_ascii=False).encode('utf-8')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(bytes([VERSION]))
+        f.write(LENGTH.pack(len(header)))
+        f.write(header)
+        for segment in segments:
+            text = segment['text'].encode('utf-8')
+            f.write(SEGMENT_HEADER.pack(int(segment['number']), float(segment['start']), float(segment['end']), len(text)))
+            f.write(text)
+    # Readers never see a half-written file
+    os.replace(tmp_path, path)
+
+
+def _read_exact(f, size, path):
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError(f"Truncated transcript file: {path}")
+    return data
+
+
+def _read_header(f, path):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"Not a transcript store file: {path}")
+    version = _read_exact(f, 1, path)[0]
+    if version != VERSION:
+        raise ValueError(f"Unsupported transcript store version {version} in {path}")
+    (length,) = LENGTH.unpack(_read_exact(f, LENGTH.size, path))
+    return json.loads(_read_exact(f, length, path).decode('utf-8'))
+
+
+def read_header(path):
+    """Return the header ({file, title, count}) of a .seg file without reading its segments."""
+    with open(path, 'rb') as f:
+        return _read_header(f, path)
+
+
+def iter_segments(path):
+    """Yield the segments of a .seg file one at a time, each carrying the shared title."""
+    with open(path, 'rb') as f:
+        header = _read_header(f, path)
+        title = header['title']
+        for _ in range(header['count']):
+            number, start, end, length = SEGMENT_HEADER.unpack(_read_exact(f, SEGMENT_HEADER.size, path))
+            yield {
+                'number': number,
+                'title': title,
+                'start': start,
+                'end': end,
+                'text': _read_exact(f, length, path).decode('utf-8')
+            }
+
+
+def _iter_json_segments(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        content = json.load(f)
+    if 'chunks' not in content:
+        raise ValueError(f"No 'chunks' found in {path}")
+    yield from content['chunks']
+
+
+def iter_transcript_files(directory):
+    """Yield (file name, segment iterator) for every transcript in a directory.
+
+    Handles both the compact .seg store and the legacy pretty-printed JSON files, so callers can
+    stream either format file by file.
+    """
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.endswith(STORE_EXTENSION):
+            yield name, iter_segments(path)
+        elif name.endswith('.json'):
+            yield name, _iter_json_segments(path)
+
+
+def _has_store_files(directory):
+    return os.path.isdir(directory) and any(n.endswith(STORE_EXTENSION) for n in os.listdir(directory))
+
+
+def transcript_source(transcripts_dir=None, jsons_dir=None):
+    """Return the directory to ingest from.
+
+    A directory the caller names is used as-is, so `--jsons-dir courses/algebra1/jsons` never
+    silently reads the default course's store. With both named, the store wins if it has .seg
+    files; with neither, the default store is used if it has files, else jsons/.
+    """
+    if transcripts_dir and jsons_dir:
+        return transcripts_dir if _has_store_files(transcripts_dir) else jsons_dir
+    if transcripts_dir or jsons_dir:
+        return transcripts_dir or jsons_dir
+    return STORE_DIR if _has_store_files(STORE_DIR) else 'jsons'
+
+
+def convert_directory(jsons_dir, store_dir):
+    """Migrate every JSON transcript in jsons_dir to a .seg file in store_dir."""
+    os.makedirs(store_dir, exist_ok=True)
+    converted = 0
+    json_bytes = 0
+    store_bytes = 0
+    for name in sorted(os.listdir(jsons_dir)):
+        if not name.endswith('.json'):
+            continue
+        source = os.path.join(jsons_dir, name)
+        try:
+            with open(source, 'r', encoding='utf-8') as f:
+                content = json.load(f)
+            chunks = content['chunks']
+            title = chunks[0]['title'] if chunks else os.path.splitext(name)[0]
+            target = os.path.join(store_dir, os.path.splitext(name)[0] + STORE_EXTENSION)
+            write_transcript(target, content.get('file', name), title, chunks)
+        except (json.JSONDecodeError, KeyError, IOError) as e:
+            print(f"Error converting {name}: {e}")
+            continue
+        converted += 1
+        json_bytes += os.path.getsize(source)
+        store_bytes += os.path.getsize(target)
+        print(f"✅ Converted: {name}")
+    return converted, json_bytes, store_bytes
+
+
+def parse_args():
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Migrate JSON transcripts to the compact transcript store.")
+    parser.add_argument('--jsons-dir', default='jsons', help="Directory containing the JSON transcripts")
+    parser.add_argument('--store-dir', default=STORE_DIR, help="Directory to write .seg files to")
+    return parser.parse_args()
+
+
+def main():
+    """Main function to convert the jsons/ directory."""
+    args = parse_args()
+    try:
+        if not os.path.exists(args.jsons_dir):
+            print(f"Error: '{args.jsons_dir}' directory not found.")
+            sys.exit(1)
+
+        converted, json_bytes, store_bytes = convert_directory(args.jsons_dir, args.store_dir)
+        if not converted:
+            print("Error: No JSON transcripts were converted.")
+            sys.exit(1)
+        print(f"\nConverted {converted} transcripts: {json_bytes / 1024:.0f} KB of JSON -> {store_bytes / 1024:.0f} KB in {args.store_dir}/")
+
+    except KeyboardInterrupt:
+        print("\nOperation cancelled by user.")
+        sys.exit(0)
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()